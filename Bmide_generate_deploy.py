@@ -1,10 +1,17 @@
 import os
 import sys
+import glob
 import argparse
-import subprocess
 import logging
 from datetime import datetime
 
+from tc_env import resolve_tc_environment
+from process_runner import run_streaming, log_tail
+from tem_phases import PhaseTracker
+from tem_preflight import run_preflight
+from tracing import span, run_traced
+from Bmide_generate_package import FINGERPRINT_FILE_NAME, load_fingerprint_record
+
 def setup_logger():
     timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     log_file = os.path.join(os.getcwd(), f"bmide_update_{timestamp}.log")
@@ -18,28 +25,23 @@ def setup_logger():
     logging.getLogger().addHandler(console_handler)
     return log_file
 
-def run_tc_env_and_get_tcroot(tc_bat):
-    logging.info(f"Running batch file to get TC_ROOT and TC_DATA: {tc_bat}")
-    process = subprocess.run(f'cmd /c "{tc_bat} && set"', capture_output=True, shell=True, text=True)
-
-    if process.returncode != 0:
-        logging.error("Failed to execute tc_env.bat")
-        logging.error(f"stderr:\n{process.stderr}")
-        sys.exit(1)
-
-    tc_root = None
-    for line in process.stdout.splitlines():
-        if line.startswith("TC_ROOT="):
-            tc_root = line.split("=", 1)[1].strip()
-            break
+def find_package(package_location, template_name):
+    """The package folder bmide_generate_package last wrote under package_location.
 
-    if not tc_root:
-        logging.error("Could not extract TC_ROOT from batch file output.")
-        logging.debug(f"Batch output:\n{process.stdout}")
+    Each generation writes a new timestamped folder, so the one recorded in the
+    package fingerprint is used, or else the newest full_update folder of the template.
+    """
+    record = load_fingerprint_record(os.path.join(package_location, FINGERPRINT_FILE_NAME))
+    recorded = [p for p in record.get("packages") or [] if os.path.isdir(p) and os.path.basename(p).startswith(f"{template_name}_")]
+    candidates = recorded or [
+        p for p in glob.glob(os.path.join(package_location, "*", "packaging", "full_update", f"{template_name}_*")) if os.path.isdir(p)
+    ]
+    if not candidates:
+        logging.error(f"No generated package of template {template_name} found under {package_location}")
         sys.exit(1)
-
-    logging.info(f"Resolved TC_ROOT: {tc_root}")
-    return tc_root
+    package_path = max(candidates, key=os.path.getmtime)
+    logging.info(f"Using package: {package_path}")
+    return package_path
 
 def build_command(tc_root, template_name, pf_file, platform, version, fullkit_path, output_path):
     if not output_path:
@@ -58,15 +60,21 @@ def build_command(tc_root, template_name, pf_file, platform, version, fullkit_pa
     logging.info(f"Constructed command: {command}")
     return command
 
-def run_command(command):
+def run_command(command, env, timing_file, template_name):
+    tracker = PhaseTracker()
     try:
-        result = subprocess.run(command, capture_output=True, shell=True, text=True)
-        logging.info(f"stdout:\n{result.stdout}")
-        logging.info(f"stderr:\n{result.stderr}")
+        # tem.bat -verbose prints a lot; stream it instead of holding it all in memory
+        with span("tem", template=template_name) as s:
+            result = run_streaming(command, env=env, on_line=tracker.on_line)
+            s.set(exit_code=result.returncode)
+        tracker.finish(result.returncode)
+        tracker.write_record(timing_file, template=template_name)
+        tracker.log_summary()
         if result.returncode == 0:
             logging.info("Command executed successfully.")
         else:
-            logging.error("Command failed.")
+            logging.error(f"Command failed with return code {result.returncode}.")
+            log_tail(result)
             sys.exit(1)
     except Exception as e:
         logging.error(f"Exception occurred: {e}")
@@ -80,17 +88,30 @@ def main():
     parser.add_argument("-platform", default="wntx64", help="Platform name, default=wntx64")
     parser.add_argument("-version", required=True, help="Template version (e.g., 1.0_2412)")
     parser.add_argument("-fullkit_path", required=True, help="Path to fullkit directory")
-    parser.add_argument("--path", required=True, help="Exact output deployment path (no dynamic naming)")
+    package = parser.add_mutually_exclusive_group(required=True)
+    package.add_argument("--path", help="Exact output deployment path (no dynamic naming)")
+    package.add_argument("-package_location", help="Workspace output folder of Bmide_generate_package.py; deploys the package it generated last")
+    parser.add_argument("-skip_preflight", action="store_true", help="Start tem.bat without checking the package, fullkit and password file first")
 
     args = parser.parse_args()
-    setup_logger()
+    log_file = setup_logger()
+    timing_file = os.path.splitext(log_file)[0] + "_phases.json"
+
+    tc_env = resolve_tc_environment(args.tc_bat)
+    tc_root = tc_env.tc_root
+    package_path = args.path or find_package(args.package_location, args.template)
 
-    tc_root = run_tc_env_and_get_tcroot(args.tc_bat)
+    if not args.skip_preflight:
+        with span("preflight") as s:
+            passed = run_preflight(tc_root, args.template, args.pf_file, args.fullkit_path, package_path)
+            s.set(exit_code=0 if passed else 1)
+        if not passed:
+            sys.exit(1)
 
     command = build_command(
-        tc_root, args.template, args.pf_file, args.platform, args.version, args.fullkit_path, args.path
+        tc_root, args.template, args.pf_file, args.platform, args.version, args.fullkit_path, package_path
     )
-    run_command(command)
+    run_command(command, tc_env.env, timing_file, args.template)
 
 if __name__ == "__main__":
-    main()
+    run_traced("Bmide_generate_deploy", main)
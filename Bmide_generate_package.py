@@ -1,10 +1,21 @@
 import os
 import sys
-import subprocess
+import glob
+import json
+import time
 import argparse
 import logging
+import xml.etree.ElementTree as ET
 from datetime import datetime
 
+from tc_env import resolve_tc_environment
+from process_runner import run_streaming, log_tail
+from fingerprint import fingerprint_trees
+from tracing import span, current_span, run_traced
+
+# Kept in packageLocation next to the packages it describes
+FINGERPRINT_FILE_NAME = "package_fingerprint.json"
+
 def setup_logger():
     timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     log_file = os.path.join(os.getcwd(), f"bmide_generate_{timestamp}.log")
@@ -21,35 +32,6 @@ def setup_logger():
 
     return log_file
 
-def run_tc_bat_file_and_capture_env(bat_file_path):
-    logging.info(f"Running batch file to set TC_ROOT and TC_DATA: {bat_file_path}")
-    process = subprocess.run(f'cmd /c "{bat_file_path} && set"', capture_output=True, shell=True, text=True)
-
-    if process.returncode != 0:
-        logging.error("Failed to execute batch file.")
-        logging.error(process.stderr)
-        sys.exit(1)
-
-    tc_root = None
-    tc_data = None
-
-    for line in process.stdout.splitlines():
-        if line.startswith("TC_ROOT="):
-            tc_root = line.split("=", 1)[1].strip()
-        elif line.startswith("TC_DATA="):
-            tc_data = line.split("=", 1)[1].strip()
-
-    if not tc_root or not tc_data:
-        logging.error("Could not extract TC_ROOT or TC_DATA from batch file output.")
-        sys.exit(1)
-
-    os.environ['TC_ROOT'] = tc_root
-    os.environ['TC_DATA'] = tc_data
-    logging.info(f"Set TC_ROOT={tc_root}")
-    logging.info(f"Set TC_DATA={tc_data}")
-
-    return tc_root, tc_data
-
 def build_bmide_generate_package_path(tc_root, bmide_generate_package_name):
     bmide_generate_package_name = bmide_generate_package_name.replace("/", "\\")
     resolved_path = os.path.join(tc_root, "bin", bmide_generate_package_name)
@@ -75,11 +57,67 @@ def build_dynamic_paths(tc_root, tc_data, workspace_folder_name):
 
     return project_location, package_location, code_generation_folder, dependency_template_folder, log_file
 
-def bmide_generate_package(bat_file_path, bmide_generate_package_path, projectLocation, packageLocation,
+def template_dependencies(dependency_file):
+    """Template names a dependency.xml declares, from the templateName (or name) of its dependency elements."""
+    try:
+        root = ET.parse(dependency_file).getroot()
+    except (OSError, ET.ParseError) as e:
+        logging.warning(f"Could not read dependencies from {dependency_file}: {e}")
+        return set()
+    names = set()
+    for element in root.iter():
+        if "dependency" in element.tag.rsplit("}", 1)[-1].lower():
+            name = element.get("templateName") or element.get("name")
+            if name:
+                names.add(name)
+    return names
+
+def dependency_template_files(project_location, package_location, dependency_template_folder, own_template):
+    """Top-level files of TC_DATA\\model the package is generated against.
+
+    tem rewrites model.xml, the backups and the project's own template in that folder
+    on every deploy, so only the <name>_template.xml and <name>_dependency.xml of the
+    templates the project depends on (directly or through other templates) are used.
+    """
+    if not os.path.isdir(dependency_template_folder):
+        return []
+    model_files = {f.lower(): f for f in os.listdir(dependency_template_folder)
+                   if os.path.isfile(os.path.join(dependency_template_folder, f))}
+
+    output_dir = os.path.normcase(os.path.abspath(package_location))
+    pending = set()
+    for root, dirs, files in os.walk(project_location):
+        dirs[:] = [d for d in dirs if os.path.normcase(os.path.abspath(os.path.join(root, d))) != output_dir]
+        for f in files:
+            if f.lower() == "dependency.xml":
+                pending |= template_dependencies(os.path.join(root, f))
+
+    if not pending:
+        # No dependency declaration found: use every template except the project's own
+        logging.warning(f"No dependency.xml found in {project_location}; fingerprinting all dependency templates.")
+        return sorted(f for key, f in model_files.items()
+                      if key.endswith(("_template.xml", "_dependency.xml")) and not key.startswith(own_template.lower() + "_"))
+
+    selected, seen = set(), set()
+    while pending:
+        name = pending.pop()
+        if name in seen or name.lower() == own_template.lower():
+            continue
+        seen.add(name)
+        for suffix in ("_template.xml", "_dependency.xml"):
+            file_name = model_files.get(f"{name}{suffix}".lower())
+            if file_name:
+                selected.add(file_name)
+        dependency_file = model_files.get(f"{name}_dependency.xml".lower())
+        if dependency_file:
+            pending |= template_dependencies(os.path.join(dependency_template_folder, dependency_file))
+    return sorted(selected)
+
+def bmide_generate_package(env, bmide_generate_package_path, projectLocation, packageLocation,
                            dependencyTemplateFolder, codeGenerationFolder, softwareVersion, buildVersion,
                            allPlatform, log_file):
     command = (
-        f'"{bat_file_path}" && "{bmide_generate_package_path}" '
+        f'"{bmide_generate_package_path}" '
         f'-projectLocation="{projectLocation}" '
         f'-packageLocation="{packageLocation}" '
     )
@@ -105,19 +143,37 @@ def bmide_generate_package(bat_file_path, bmide_generate_package_path, projectLo
     logging.info(f"Constructed command: {command}")
 
     try:
-        result = subprocess.run(command, capture_output=True, shell=True, text=True)
+        result = run_streaming(command, env=env)
+        current_span().set(exit_code=result.returncode)
         if result.returncode == 0:
             logging.info("Successfully executed BMIDE generate package command.")
-            logging.info(f"stdout:\n{result.stdout}")
         else:
-            logging.error("Command failed.")
-            logging.error(f"stderr:\n{result.stderr}")
-            logging.error(f"stdout:\n{result.stdout}")
+            logging.error(f"Command failed with return code {result.returncode}.")
+            log_tail(result)
             sys.exit(1)
     except Exception as e:
         logging.error(f"Exception occurred while executing command: {e}")
         sys.exit(1)
 
+def load_fingerprint_record(fingerprint_file):
+    try:
+        with open(fingerprint_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_fingerprint_record(fingerprint_file, record):
+    tmp_file = fingerprint_file + ".tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(record, f, indent=2)
+    os.replace(tmp_file, fingerprint_file)
+
+def find_generated_packages(package_location, since):
+    """Return the package folders and zips under package_location written after `since`."""
+    candidates = glob.glob(os.path.join(package_location, "*", "packaging", "*", "*"))
+    candidates += glob.glob(os.path.join(package_location, "*.zip"))
+    return sorted(path for path in candidates if os.path.getmtime(path) >= since)
+
 def main():
     parser = argparse.ArgumentParser(description="BMIDE package generation script")
 
@@ -130,14 +186,16 @@ def main():
     parser.add_argument("-softwareVersion", type=str, help="Software version")
     parser.add_argument("-buildVersion", type=str, help="Build version")
     parser.add_argument("-allPlatform", action='store_true', help="Flag to include all platforms")
+    parser.add_argument("-force", action='store_true', help="Generate the package even if the workspace fingerprint is unchanged")
 
     args = parser.parse_args()
 
     setup_logger()
     logging.info("Starting BMIDE package generation process...")
 
-    # Get TC_ROOT and TC_DATA from environment
-    tc_root, tc_data = run_tc_bat_file_and_capture_env(args.tc_bat)
+    # Get TC_ROOT and TC_DATA from the (cached) TC environment
+    tc_env = resolve_tc_environment(args.tc_bat)
+    tc_root, tc_data = tc_env.tc_root, tc_env.tc_data
 
     # Always construct bmide_generate_package path under TC_ROOT\bin
     bmide_generate_package_path = build_bmide_generate_package_path(tc_root, args.bmide_generate_package)
@@ -146,21 +204,64 @@ def main():
     projectLocation, packageLocation, codeGenerationFolder, dependencyTemplateFolder, log_file = build_dynamic_paths(
         tc_root, tc_data, args.workspace_folder_name)
 
+    # The package only depends on the project sources and the dependency templates, so an
+    # unchanged fingerprint means the last generated package can be reused as it is
+    fingerprint_file = os.path.join(packageLocation, FINGERPRINT_FILE_NAME)
+    record = load_fingerprint_record(fingerprint_file)
+    options = {"softwareVersion": args.softwareVersion, "buildVersion": args.buildVersion, "allPlatform": args.allPlatform}
+    own_template = os.path.basename(os.path.normpath(projectLocation))
+    with span("fingerprint") as s:
+        model_files = dependency_template_files(projectLocation, packageLocation, dependencyTemplateFolder, own_template)
+        model_skip = [f for f in os.listdir(dependencyTemplateFolder) if f not in model_files] if os.path.isdir(dependencyTemplateFolder) else []
+        fingerprint, files = fingerprint_trees(
+            {
+                "project": (projectLocation, [os.path.relpath(packageLocation, projectLocation)]),
+                "model": (dependencyTemplateFolder, model_skip),
+            },
+            record.get("files"),
+            extra=options,
+        )
+        s.add(sum(entry["size"] for entry in files.values()), len(files))
+    logging.info(f"Workspace fingerprint: {fingerprint} ({len(files)} files)")
+
+    packages = record.get("packages") or []
+    if not args.force and record.get("fingerprint") == fingerprint and packages and all(os.path.exists(p) for p in packages):
+        logging.info("Workspace and dependency templates unchanged since the last package generation.")
+        for package in packages:
+            logging.info(f"Package: {package}")
+        return
+
     # Run BMIDE package generation
-    bmide_generate_package(
-        args.tc_bat,
-        bmide_generate_package_path,
-        projectLocation,
-        packageLocation,
-        dependencyTemplateFolder,
-        codeGenerationFolder,
-        args.softwareVersion,
-        args.buildVersion,
-        args.allPlatform,
-        log_file
-    )
+    started = time.time()
+    with span("bmide_generate_package"):
+        bmide_generate_package(
+            tc_env.env,
+            bmide_generate_package_path,
+            projectLocation,
+            packageLocation,
+            dependencyTemplateFolder,
+            codeGenerationFolder,
+            args.softwareVersion,
+            args.buildVersion,
+            args.allPlatform,
+            log_file
+        )
+
+    packages = find_generated_packages(packageLocation, started)
+    if not packages:
+        logging.warning(f"No newly generated package found under {packageLocation}; the fingerprint is not recorded.")
+    else:
+        for package in packages:
+            logging.info(f"Package: {package}")
+        save_fingerprint_record(fingerprint_file, {
+            "fingerprint": fingerprint,
+            "packages": packages,
+            "options": options,
+            "created": datetime.now().isoformat(),
+            "files": files,
+        })
 
     logging.info("Build process completed successfully.")
 
 if __name__ == "__main__":
-    main()
+    run_traced("Bmide_generate_package", main)
@@ -1,10 +1,30 @@
 import os
+import re
+import sys
+import json
+import hashlib
 import subprocess
 import shutil
 import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import argparse
 
+# The shared helpers live in the repository root, two levels up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from tc_env import environment_delta, apply_environment_delta
+from hash_utils import sha256_file, sha256_text
+
+# Folders that hold build output or IDE state, never sources
+SKIP_DIRS = {".vs", "x64", "x86", "Debug", "Release"}
+SOURCE_EXTENSIONS = {".sln", ".vcxproj", ".filters", ".props", ".targets", ".c", ".cpp", ".cxx", ".h", ".hpp", ".hxx", ".rc", ".def"}
+DEFAULT_VS_PATH = r"C:\Program Files (x86)\Microsoft Visual Studio\2019\Community"
+VS_ENV_CACHE_DIR = os.path.join(os.getenv('TEMP', tempfile.gettempdir()), 'vs_env_cache')
+# Cached with their full value even when the capturing shell (a developer prompt) already had them
+VS_ALWAYS_CACHED_PREFIXES = ("VC", "VS", "WindowsSdk", "WindowsSDK", "UCRT", "INCLUDE", "LIB", "Platform")
+SLN_PROJECT = re.compile(r'^Project\("\{[^}]+\}"\)\s*=\s*"([^"]+)",\s*"([^"]+\.vcxproj)"', re.MULTILINE)
+
 # Setup logger to track the build and deployment process
 def setup_logger():
     timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
@@ -22,27 +42,62 @@ def setup_logger():
 
     return log_file
 
+def vs_env_cache_file(vs_path, arch):
+    key = f"{os.path.normcase(os.path.abspath(vs_path))}|{arch}"
+    return os.path.join(VS_ENV_CACHE_DIR, f"{sha256_text(key)[:16]}.json")
+
+# Run vcvarsall.bat and capture the variables it adds or changes, as "set" prints them afterwards
+def capture_vcvars_environment(vcvars_path, arch):
+    process = subprocess.run(f'cmd /c ""{vcvars_path}" {arch} && set"', shell=True, capture_output=True, text=True)
+    if process.returncode != 0:
+        logging.error(f"Failed to set up Visual Studio environment. Error: {process.stderr}")
+        return None
+
+    env = {}
+    for line in process.stdout.splitlines():
+        # Skip the vcvars banner and cmd's hidden per-drive variables such as "=C:=C:\"
+        if "=" not in line or line.startswith("="):
+            continue
+        key, value = line.split("=", 1)
+        env[key] = value.rstrip("\r")
+    return environment_delta(env, os.environ, VS_ALWAYS_CACHED_PREFIXES)
+
 # Step 1: Set up Visual Studio environment using vcvarsall.bat
-def setup_visual_studio_env():
-    # Correct path to vcvarsall.bat
-    vcvars_path = r"C:\\Program Files (x86)\\Microsoft Visual Studio\\2019\\Community\\VC\\Auxiliary\\Build\\vcvarsall.bat"
-    
+def setup_visual_studio_env(vs_path=DEFAULT_VS_PATH, arch="x64", refresh=False):
+    """Return os.environ with the changes vcvarsall.bat makes for arch, cached per VS install and arch."""
+    vcvars_path = os.path.join(vs_path, "VC", "Auxiliary", "Build", "vcvarsall.bat")
+
     if not os.path.exists(vcvars_path):
         logging.error(f"vcvarsall.bat not found at {vcvars_path}")
-        return False
+        return None
 
-    # Run vcvarsall.bat within PowerShell to set environment variables in the same session
-    process = subprocess.run(
-        [f"powershell.exe",f"& '{vcvars_path}' x64"],
-        shell=True, capture_output=True, text=True
-    )
+    # The cache is valid as long as vcvarsall.bat is the same file; a VS update rewrites it
+    cache_file = vs_env_cache_file(vs_path, arch)
+    vcvars_mtime = os.stat(vcvars_path).st_mtime_ns
+    if not refresh:
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            # A delta without the toolset folder was captured before the VS variables were always kept
+            if cached.get("vcvars_mtime_ns") == vcvars_mtime and "VCToolsInstallDir" in cached["delta"]:
+                logging.info(f"Using cached Visual Studio environment: {cache_file}")
+                return apply_environment_delta(cached["delta"], os.environ)
+        except (OSError, ValueError, KeyError):
+            pass
+
+    logging.info(f"Running {vcvars_path} {arch} to capture the Visual Studio environment")
+    delta = capture_vcvars_environment(vcvars_path, arch)
+    if delta is None:
+        return None
 
-    if process.returncode != 0:
-        logging.error(f"Failed to set up Visual Studio environment. Error: {process.stderr}")
-        return False
+    os.makedirs(VS_ENV_CACHE_DIR, exist_ok=True)
+    tmp_path = cache_file + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"vs_path": vs_path, "arch": arch, "vcvars_mtime_ns": vcvars_mtime, "delta": delta}, f, indent=2)
+    os.replace(tmp_path, cache_file)
 
     logging.info("Visual Studio environment set up successfully.")
-    return True
+    return apply_environment_delta(delta, os.environ)
 
 # Step 2: Extract TC_ROOT from the tcvar.bat or tcvar file
 def extract_tc_root(tc_bat_path):
@@ -67,51 +122,112 @@ def extract_tc_root(tc_bat_path):
     logging.error("TC_ROOT not found in tcvar.bat output.")
     return None
 
-# Step 3: Build the ITK Project
-def build_itk_project(project_dir):
-    logging.info(f"Building ITK project at {project_dir}")
+# Find every solution under root_dir, leaving out build output and IDE folders
+def discover_solutions(root_dir):
+    solutions = []
+    for root, dirs, files in os.walk(root_dir):
+        dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS)
+        solutions.extend(os.path.join(root, f) for f in sorted(files) if f.lower().endswith(".sln"))
+    return solutions
+
+# Names of the C++ projects in a solution; each builds <name>.exe
+def solution_projects(solution_path):
+    with open(solution_path, 'r', encoding='utf-8-sig', errors='replace') as f:
+        return [name for name, _ in SLN_PROJECT.findall(f.read())]
+
+# Hash every source file of the solution, together with anything else that changes the build output
+def source_hash(solution_dir, extra):
+    digest = hashlib.sha256(json.dumps(extra, sort_keys=True).encode("utf-8"))
+    for root, dirs, files in os.walk(solution_dir):
+        dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS)
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in SOURCE_EXTENSIONS:
+                file_path = os.path.join(root, name)
+                rel_path = os.path.relpath(file_path, solution_dir).replace(os.sep, "/")
+                digest.update(f"{rel_path} {sha256_file(file_path)}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+def build_cache_file(solution_path):
+    solution_dir = os.path.dirname(solution_path)
+    name = os.path.splitext(os.path.basename(solution_path))[0]
+    return os.path.join(solution_dir, "x64", "Release", f"{name}.build.json")
+
+def load_build_cache(solution_path):
+    try:
+        with open(build_cache_file(solution_path), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_build_cache(solution_path, record):
+    cache_file = build_cache_file(solution_path)
+    tmp_path = cache_file + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(record, f, indent=2)
+    os.replace(tmp_path, cache_file)
 
-    # Automatically derive the project name from the folder name
-    project_name = os.path.basename(project_dir)
+# Step 3: Build the ITK Project
+def build_itk_project(solution_path, tc_root, vs_env, force=False):
+    """Build one solution unless its sources are unchanged since the last build. Returns its .exe paths or None."""
+    solution_dir = os.path.dirname(solution_path)
+    solution_name = os.path.splitext(os.path.basename(solution_path))[0]
+    # The solution output folder is x64/Release next to the .sln
+    exe_paths = [os.path.join(solution_dir, "x64", "Release", f"{name}.exe") for name in solution_projects(solution_path)]
 
-    solution_path = os.path.join(project_dir, f"{project_name}.sln")
+    current_hash = source_hash(solution_dir, {"configuration": "Release", "platform": "x64", "tc_root": tc_root, "vc_tools": vs_env.get("VCToolsVersion")})
+    cached = load_build_cache(solution_path)
+    if not force and cached.get("source_hash") == current_hash and exe_paths and all(os.path.exists(p) for p in exe_paths):
+        logging.info(f"Sources of {solution_name} unchanged since the last build, skipping msbuild.")
+        return exe_paths
 
-    if not os.path.exists(solution_path):
-        logging.error(f"Solution file {project_name}.sln not found in the project folder.")
-        return None
+    logging.info(f"Building ITK solution {solution_path}")
 
-    # MSBuild command to build the project
-    msbuild_command = f'msbuild "{solution_path}" /p:Configuration=Release /p:Platform=x64'
+    # /m builds the projects of the solution in parallel
+    msbuild_command = f'msbuild "{solution_path}" /m /nologo /v:minimal /p:Configuration=Release /p:Platform=x64'
 
-    # Run MSBuild to build the project
-    process = subprocess.run(msbuild_command, capture_output=True, shell=True, text=True)
+    # Run MSBuild with the Visual Studio environment, so the msbuild and compiler of that install are used
+    process = subprocess.run(msbuild_command, capture_output=True, shell=True, text=True, env=vs_env)
 
     if process.returncode != 0:
-        logging.error(f"Build failed for {project_name}")
+        logging.error(f"Build failed for {solution_name}")
+        # msbuild reports compiler errors on stdout
+        logging.error(process.stdout)
         logging.error(process.stderr)
         return None
 
-    logging.info(f"Build completed successfully for {project_name}")
+    logging.info(f"Build completed successfully for {solution_name}")
 
-    # Assuming the .exe is located in the project's x64/Release folder
-    exe_path = os.path.join(project_dir, "x64", "Release", f"{project_name}.exe")
-    if os.path.exists(exe_path):
-        logging.info(f".exe file generated: {exe_path}")
-        return exe_path
-    else:
-        logging.error(f".exe file not found in: {exe_path}")
+    missing = [p for p in exe_paths if not os.path.exists(p)]
+    if not exe_paths or missing:
+        logging.error(f".exe file not found in: {missing or os.path.join(solution_dir, 'x64', 'Release')}")
         return None
 
+    for exe_path in exe_paths:
+        logging.info(f".exe file generated: {exe_path}")
+    save_build_cache(solution_path, {"source_hash": current_hash, "built": datetime.now().isoformat()})
+    return exe_paths
+
+# Build the solutions on a bounded pool; returns {solution path: exe paths or None}
+def build_all(solutions, tc_root, vs_env, max_parallel, force=False):
+    with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+        results = executor.map(lambda s: build_itk_project(s, tc_root, vs_env, force), solutions)
+        return dict(zip(solutions, results))
+
 # Step 4: Deploy the generated .exe to the bin folder
 def deploy_exe_to_bin(exe_path, bin_folder):
+    deployed_path = os.path.join(bin_folder, os.path.basename(exe_path))
+    if os.path.isfile(deployed_path) and sha256_file(deployed_path) == sha256_file(exe_path):
+        logging.info(f"{deployed_path} is identical to {exe_path}, not deploying.")
+        return True
+
     logging.info(f"Deploying .exe to {bin_folder}")
 
     # Ensure the bin folder exists
     os.makedirs(bin_folder, exist_ok=True)
 
-    # Move the .exe file to the bin folder
+    # Copy the .exe file to the bin folder
     try:
-        shutil.copy(exe_path, bin_folder)
+        shutil.copy2(exe_path, bin_folder)
         logging.info(f"Successfully deployed {exe_path} to {bin_folder}")
         return True
     except Exception as e:
@@ -121,9 +237,15 @@ def deploy_exe_to_bin(exe_path, bin_folder):
 # Main execution
 def main():
     # Setup argparse for command line arguments
-    parser = argparse.ArgumentParser(description="Build and deploy ITK project.")
-    parser.add_argument("--target-path", required=True, help="Path to the ITK project folder")
+    parser = argparse.ArgumentParser(description="Build and deploy ITK projects.")
+    parser.add_argument("--target-path", required=True, help="ITK project folder, or a folder such as Custom_Utilities searched for .sln files")
     parser.add_argument("--tc-bat", required=True, help="Path to tcvar.bat or file to extract TC_ROOT")
+    parser.add_argument("--max-parallel", type=int, default=2, help="Number of solutions built at once (each msbuild also uses /m)")
+    parser.add_argument("--force", action="store_true", help="Rebuild even when the sources are unchanged")
+    parser.add_argument("--vs-path", default=DEFAULT_VS_PATH, help="Visual Studio install folder (contains VC\\Auxiliary\\Build\\vcvarsall.bat)")
+    parser.add_argument("--arch", default="x64", help="vcvarsall.bat target architecture")
+    parser.add_argument("--refresh-vs-env", action="store_true", help="Re-run vcvarsall.bat instead of using the cached environment")
+    parser.add_argument("--deploy", action="store_true", help="Copy the built .exe files to TC_ROOT\\bin when they differ from the deployed ones")
 
     args = parser.parse_args()
 
@@ -132,35 +254,46 @@ def main():
     # Step 1: Check if the ITK project folder exists
     if not os.path.exists(args.target_path):
         logging.error(f"Deployment failed: Folder does not exist: {args.target_path}")
-        return
+        sys.exit(1)
+
+    solutions = discover_solutions(args.target_path)
+    if not solutions:
+        logging.error(f"Deployment failed: No .sln file found under {args.target_path}")
+        sys.exit(1)
+    logging.info(f"Found {len(solutions)} solution(s): {solutions}")
 
     # Step 2: Extract TC_ROOT using tcvar.bat
     tc_root = extract_tc_root(args.tc_bat)
     if not tc_root:
         logging.error("Deployment failed: TC_ROOT extraction failed.")
-        return
+        sys.exit(1)
 
     # Step 3: Construct the bin folder path based on TC_ROOT
     bin_folder = os.path.join(tc_root, "bin")
     logging.info(f"Bin folder path: {bin_folder}")
 
     # Step 4: Set up Visual Studio environment
-    if not setup_visual_studio_env():
+    vs_env = setup_visual_studio_env(args.vs_path, args.arch, args.refresh_vs_env)
+    if not vs_env:
         logging.error("Deployment failed: Visual Studio environment setup failed.")
-        return
-
-    # Step 5: Build the ITK project (no need to pass project name anymore)
-    exe_path = build_itk_project(args.target_path)
-    if not exe_path:
-        logging.error("Build failed, .exe not generated.")
-        return
-
-    # Step 6: Deploy the .exe to the bin folder
-    # if not deploy_exe_to_bin(exe_path, bin_folder):
-    #     logging.error("Deployment failed.")
-    #     return
-
-    logging.info("Project successfully built and deployed!")
+        sys.exit(1)
+
+    # Step 5: Build the ITK solutions, skipping the unchanged ones
+    results = build_all(solutions, tc_root, vs_env, args.max_parallel, args.force)
+    failed = [solution for solution, exe_paths in results.items() if not exe_paths]
+    if failed:
+        logging.error(f"Build failed, .exe not generated for: {failed}")
+        sys.exit(1)
+
+    # Step 6: Deploy the .exe files to the bin folder
+    if args.deploy:
+        for exe_paths in results.values():
+            for exe_path in exe_paths:
+                if not deploy_exe_to_bin(exe_path, bin_folder):
+                    logging.error("Deployment failed.")
+                    sys.exit(1)
+
+    logging.info("Projects successfully built and deployed!")
 
 if __name__ == "__main__":
     main()
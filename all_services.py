@@ -1,59 +1,105 @@
 import subprocess
 import sys
+import os
+import json
+import time
+import fnmatch
 import logging
-import re
+import argparse
+import tempfile
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[logging.StreamHandler(sys.stdout)]  # Log to stdout for Jenkins
-)
+# Snapshot of Get-Service shared by all_services.py and list_services.py
+INVENTORY_FILE = os.path.join(os.getenv('TEMP', tempfile.gettempdir()), 'service_inventory.json')
+DEFAULT_TTL = 300
 
-def list_services():
-    # PowerShell command to list services on the local machine
+def fetch_services():
+    """Enumerate the local services as a list of {"Name", "DisplayName", "Status"} dicts."""
+    # Status is an enum; convert it so the JSON holds "Running" rather than 4
     command = """
-    Get-Service | Select-Object -Property Name, Status, DisplayName
+    $services = Get-Service | Select-Object -Property Name, DisplayName, @{ Name = 'Status'; Expression = { $_.Status.ToString() } }
+    ConvertTo-Json -InputObject @($services) -Compress
     """
-    
+    logging.info("Fetching list of services from local machine...")
+    result = subprocess.run(
+        ["powershell", "-NoProfile", "-Command", command],
+        check=True,
+        capture_output=True,
+        text=True
+    )
+    services = json.loads(result.stdout)
+    # A few drivers and per-user services have no display name
+    for service in services:
+        service["DisplayName"] = service["DisplayName"] or ""
+    return services
+
+def save_inventory(services, inventory_file=INVENTORY_FILE):
+    tmp_file = f"{inventory_file}.{os.getpid()}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump({"created": time.time(), "services": services}, f)
+    os.replace(tmp_file, inventory_file)
+
+def load_inventory(ttl=DEFAULT_TTL, refresh=False, inventory_file=INVENTORY_FILE):
+    """Return the service list, from the on-disk snapshot when it is younger than ttl seconds."""
+    if not refresh and os.path.isfile(inventory_file):
+        try:
+            with open(inventory_file, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            age = time.time() - snapshot["created"]
+            if 0 <= age < ttl:
+                logging.info(f"Using service inventory from {inventory_file} ({age:.0f}s old).")
+                return snapshot["services"]
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Ignoring unreadable service inventory {inventory_file}: {e}")
+
+    services = fetch_services()
+    save_inventory(services, inventory_file)
+    logging.info(f"Services fetched successfully ({len(services)} services).")
+    return services
+
+def filter_services(services, pattern):
+    """Keep services whose name or display name matches a case-insensitive wildcard pattern."""
+    pattern = pattern.lower()
+    return [
+        s for s in services
+        if fnmatch.fnmatch(s["Name"].lower(), pattern) or fnmatch.fnmatch(s["DisplayName"].lower(), pattern)
+    ]
+
+def list_services(ttl=DEFAULT_TTL, refresh=False, pattern=None):
     try:
-        # Run the PowerShell command locally and capture the output
-        logging.info("Fetching list of services from local machine...")
-        result = subprocess.run(
-            ["powershell", "-Command", command],
-            check=True,
-            capture_output=True,
-            text=True
-        )
-        
-        services = result.stdout.strip().split("\n")
-        logging.info("Services fetched successfully.")
-
-        # Logging service details
-        logging.info(f"{'Service Name':<40}{'Display Name':<50}{'Status':<15}")
-        logging.info("-" * 120)
-
-        # Regex pattern to capture Name, Status, and DisplayName
-        pattern = re.compile(r"^(?P<name>\S+)\s+(?P<status>\S+)\s+(?P<display_name>.+)$")
-
-        for service in services:
-            # Try matching the service line
-            match = pattern.match(service.strip())
-            if match:
-                service_info = match.groupdict()
-                logging.info(f"{service_info['name']:<40}{service_info['display_name']:<50}{service_info['status']:<15}")
-            else:
-                logging.warning(f"Skipping invalid service format: {service}")
-        
+        services = load_inventory(ttl, refresh)
     except subprocess.CalledProcessError as e:
         logging.error(f"Failed to list services. Error: {e}")
         logging.error("Output: %s", e.output)
         logging.error("Error: %s", e.stderr)
         sys.exit(1)
+    except ValueError as e:
+        logging.error(f"Could not parse the service list: {e}")
+        sys.exit(1)
+
+    if pattern:
+        services = filter_services(services, pattern)
+
+    # Logging service details
+    logging.info(f"{'Service Name':<40}{'Display Name':<50}{'Status':<15}")
+    logging.info("-" * 120)
+    for service in services:
+        logging.info(f"{service['Name']:<40}{service['DisplayName']:<50}{service['Status']:<15}")
 
 def main():
+    parser = argparse.ArgumentParser(description="List the services on the local machine.")
+    parser.add_argument("--filter", dest="pattern", help="Wildcard matched against service and display names, e.g. 'Teamcenter*'")
+    parser.add_argument("--ttl", type=int, default=DEFAULT_TTL, help="Reuse the cached inventory if it is younger than this many seconds")
+    parser.add_argument("--refresh", action="store_true", help="Ignore the cached inventory and query the services again")
+    args = parser.parse_args()
+
+    # Configure logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)]  # Log to stdout for Jenkins
+    )
     logging.info("Starting the service listing process.")
-    list_services()
+    list_services(args.ttl, args.refresh, args.pattern)
 
 if __name__ == "__main__":
     main()
@@ -1,12 +1,20 @@
 import os
 import sys
-import subprocess
+import json
+import shutil
 import argparse
 import logging
-import shutil
+import subprocess
 from pathlib import Path
 from datetime import datetime
-import zipfile
+
+from tc_env import resolve_tc_environment
+from process_runner import run_streaming, log_tail
+from snapshot_store import create_snapshot, apply_retention
+from tree_sync import sync_tree
+from build_cache import merkle_hash, restore_outputs, store_outputs, prune_cache
+from hash_utils import sha256_file, sha256_text
+from tracing import span, run_traced
 
 
 def setup_logger():
@@ -26,54 +34,27 @@ def setup_logger():
     return log_file
 
 
-def run_tc_bat_file_and_capture_env(bat_file_path):
-    logging.info(f"Running batch file to set TC_ROOT and TC_DATA: {bat_file_path}")
-    process = subprocess.run(f'cmd /c "{bat_file_path} && set"', capture_output=True, shell=True, text=True)
-
-    if process.returncode != 0:
-        logging.error("Failed to execute batch file.")
-        logging.error(process.stderr)
-        sys.exit(1)
-
-    tc_root = None
-    tc_data = None
-
-    for line in process.stdout.splitlines():
-        if line.startswith("TC_ROOT="):
-            tc_root = line.split("=", 1)[1].strip()
-        elif line.startswith("TC_DATA="):
-            tc_data = line.split("=", 1)[1].strip()
-
-    if not tc_root or not tc_data:
-        logging.error("Could not extract TC_ROOT or TC_DATA from batch file output.")
-        sys.exit(1)
-
-    os.environ['TC_ROOT'] = tc_root
-    os.environ['TC_DATA'] = tc_data
-    logging.info(f"Set TC_ROOT={tc_root}")
-    logging.info(f"Set TC_DATA={tc_data}")
-
-    return tc_root
-
-
-def backup_aws2_folder(tc_root):
+def backup_aws2_folder(tc_root, exclude_patterns, keep):
     aws2_path = os.path.join(tc_root, "aws2")
     if not os.path.exists(aws2_path):
         logging.warning(f"No aws2 folder found at {aws2_path}, skipping backup.")
         return
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_zip_path = os.path.join(os.path.dirname(aws2_path), f"aws2_backup_{timestamp}.zip")
-
-    logging.info(f"Creating backup of aws2 folder: {backup_zip_path}")
-    with zipfile.ZipFile(backup_zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for root, _, files in os.walk(aws2_path):
-            for file in files:
-                abs_file_path = os.path.join(root, file)
-                rel_path = os.path.relpath(abs_file_path, os.path.dirname(aws2_path))
-                zipf.write(abs_file_path, rel_path)
+    # Content-addressed store: unchanged files are kept once across all backups
+    store_dir = os.path.join(os.path.dirname(aws2_path), "aws2_backups")
+    logging.info(f"Creating snapshot of aws2 folder in: {store_dir} (excluding {exclude_patterns})")
+    try:
+        with span("backup") as s:
+            snapshot_path, stats = create_snapshot(aws2_path, store_dir, exclude_patterns, name="aws2")
+            s.add(stats["total_bytes"], stats["files"])
+            s.set(stored_bytes=stats["stored_bytes"])
+        if keep > 0:
+            apply_retention(store_dir, keep)
+    except OSError as e:
+        logging.error(f"Backup of aws2 folder failed: {e}")
+        sys.exit(1)
 
-    logging.info("Backup completed successfully.")
+    logging.info(f"Backup completed successfully: {snapshot_path}")
 
 
 def validate_environment(tc_root, target_path):
@@ -102,72 +83,119 @@ def validate_environment(tc_root, target_path):
     return stage_path
 
 
-def replace_stage_with_target(stage_path, target_path):
-    logging.info(f"Clearing stage directory: {stage_path}")
-    for item in os.listdir(stage_path):
-        item_path = os.path.join(stage_path, item)
-        try:
-            if os.path.isfile(item_path) or os.path.islink(item_path):
-                os.unlink(item_path)
-            elif os.path.isdir(item_path):
-                shutil.rmtree(item_path)
-        except Exception as e:
-            logging.error(f"Failed to delete {item_path}: {e}")
-            sys.exit(1)
-
-    logging.info(f"Copying contents from {target_path} to {stage_path}")
-    for item in os.listdir(target_path):
-        s = os.path.join(target_path, item)
-        d = os.path.join(stage_path, item)
-        try:
-            if os.path.isdir(s):
-                shutil.copytree(s, d)
-            else:
-                shutil.copy2(s, d)
-        except Exception as e:
-            logging.error(f"Failed to copy {s} to {d}: {e}")
-            sys.exit(1)
-
-    logging.info("Stage folder successfully replaced with target folder contents.")
-
-
-def run_awbuild_in_stage(stage_path):
+def replace_stage_with_target(stage_path, target_path, checksum=False):
+    # Delta sync: only changed files are copied and only files missing from the target are deleted
+    logging.info(f"Syncing stage directory {stage_path} with {target_path}")
+    try:
+        with span("stage_sync") as s:
+            stats = sync_tree(target_path, stage_path, checksum=checksum)
+            s.add(stats["copied_bytes"], stats["copied_files"])
+            s.set(skipped_files=stats["skipped_files"], deleted_files=stats["deleted_files"])
+    except OSError as e:
+        logging.error(f"Failed to sync {target_path} to {stage_path}: {e}")
+        sys.exit(1)
+
+    logging.info("Stage folder successfully synced with target folder contents.")
+
+
+def run_awbuild_in_stage(stage_path, env):
     awbuild_bat = os.path.join(stage_path, "awbuild.cmd")
     if not os.path.exists(awbuild_bat):
         logging.error(f"'awbuild.bat' not found in stage folder: {awbuild_bat}")
         sys.exit(1)
 
     logging.info(f"Running awbuild.bat inside: {stage_path}")
-    process = subprocess.run(f'cmd /c "{awbuild_bat}"', cwd=stage_path, capture_output=True, text=True, shell=True)
+    with span("awbuild") as s:
+        process = run_streaming(f'cmd /c "{awbuild_bat}"', cwd=stage_path, env=env)
+        s.set(exit_code=process.returncode)
 
     if process.returncode != 0:
         logging.error("awbuild.bat failed to execute successfully.")
-        logging.error(f"STDOUT:\n{process.stdout}")
-        logging.error(f"STDERR:\n{process.stderr}")
+        log_tail(process)
         sys.exit(1)
 
     logging.info("awbuild.bat executed successfully.")
-    logging.info(f"STDOUT:\n{process.stdout}")
-    logging.info(f"STDERR:\n{process.stderr}")
+
+
+def tool_version(tool, env):
+    """First line of `tool --version`, found on the PATH awbuild will see, or None when it is missing."""
+    tool_path = shutil.which(tool, path=env.get("PATH") or env.get("Path"))
+    if not tool_path:
+        return None
+    try:
+        process = subprocess.run([tool_path, "--version"], env=env, capture_output=True, text=True, timeout=60)
+    except (OSError, subprocess.SubprocessError) as e:
+        logging.warning(f"Could not get the {tool} version: {e}")
+        return None
+    lines = process.stdout.strip().splitlines()
+    return f"{tool_path} {lines[0] if lines else ''}"
+
+
+def toolchain_fingerprint(tc_root, env, toolchain_paths):
+    """What awbuild runs with outside the stage folder: node and npm, and the given TC_ROOT files or folders."""
+    fingerprint = {"node": tool_version("node", env), "npm": tool_version("npm", env)}
+    for rel_path in toolchain_paths:
+        path = os.path.join(tc_root, rel_path)
+        if os.path.isdir(path):
+            fingerprint[rel_path] = merkle_hash(path)
+        elif os.path.isfile(path):
+            fingerprint[rel_path] = sha256_file(path)
+        else:
+            fingerprint[rel_path] = None
+    return fingerprint
+
+
+def build_stage(stage_path, env, cache_dir, output_dirs, force=False, keep=5, toolchain=None):
+    # Identical stage inputs built by the same toolchain produce identical awbuild outputs,
+    # so reuse them when the hash matches
+    with span("stage_hash"):
+        stage_hash = merkle_hash(stage_path, skip_paths=output_dirs)
+    key = sha256_text(json.dumps({"stage": stage_hash, "toolchain": toolchain or {}}, sort_keys=True))
+    logging.info(f"Stage input hash: {stage_hash}, build cache key: {key}")
+
+    with span("build_cache_restore") as s:
+        restored = not force and restore_outputs(cache_dir, key, stage_path, output_dirs)
+        s.set(hit=restored)
+    if restored:
+        logging.info(f"Restored awbuild outputs {output_dirs} from cache, skipping awbuild.")
+        return
+
+    run_awbuild_in_stage(stage_path, env)
+    try:
+        store_outputs(cache_dir, key, stage_path, output_dirs)
+        prune_cache(cache_dir, keep)
+    except OSError as e:
+        logging.warning(f"Could not cache awbuild outputs: {e}")
 
 
 def main():
     parser = argparse.ArgumentParser(description="AWS Stage Manager: Replace stage folder and run awbuild.bat")
     parser.add_argument("-target_path", type=str, required=True, help="Directory containing stage folder contents to copy")
     parser.add_argument("-tc_bat", type=str, required=True, help="Path to batch file to set TC environment")
+    parser.add_argument("-sync_checksum", action="store_true", help="Compare stage files by content hash instead of size and mtime")
+    parser.add_argument("-build_outputs", nargs="+", default=["out"], help="Stage-relative directories produced by awbuild, cached by stage hash (default: out)")
+    parser.add_argument("-build_cache_keep", type=int, default=5, help="Number of awbuild results kept in the cache (default 5)")
+    parser.add_argument("-force_build", action="store_true", help="Run awbuild even when a cached result matches the stage hash")
+    parser.add_argument("-build_toolchain", nargs="*", default=[], help="TC_ROOT-relative files or folders awbuild depends on outside the stage (e.g. a version file); their hash joins the build cache key with the node and npm versions")
+    parser.add_argument("-backup_exclude", nargs="*", default=["node_modules"], help="fnmatch patterns (path or path component) excluded from the aws2 backup, default: node_modules")
+    parser.add_argument("-backup_keep", type=int, default=10, help="Number of aws2 backups to retain, 0 keeps all (default 10)")
     args = parser.parse_args()
 
     setup_logger()
     logging.info("Starting AWS stage manager process...")
 
-    tc_root = run_tc_bat_file_and_capture_env(args.tc_bat)
-    backup_aws2_folder(tc_root)
+    tc_env = resolve_tc_environment(args.tc_bat)
+    tc_root = tc_env.tc_root
+    backup_aws2_folder(tc_root, args.backup_exclude, args.backup_keep)
     stage_path = validate_environment(tc_root, args.target_path)
-    replace_stage_with_target(stage_path, args.target_path)
-    run_awbuild_in_stage(stage_path)
+    replace_stage_with_target(stage_path, args.target_path, args.sync_checksum)
+    cache_dir = os.path.join(tc_root, "aws2_build_cache")
+    toolchain = toolchain_fingerprint(tc_root, tc_env.env, args.build_toolchain)
+    logging.info(f"awbuild toolchain: {toolchain}")
+    build_stage(stage_path, tc_env.env, cache_dir, args.build_outputs, args.force_build, args.build_cache_keep, toolchain)
 
     logging.info("Build process completed successfully.")
 
 
 if __name__ == "__main__":
-    main()
+    run_traced("awcDeploymentScript", main)
@@ -0,0 +1,206 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+
+# Stand-in for the Teamcenter and Windows tools the deploy scripts call, so they can be
+# timed on Linux. run_benchmarks.py puts wrappers named after each tool on PATH or under
+# TC_ROOT that run "fake_tool.py <tool> <args>".
+#
+# BENCH_LATENCY       seconds each call takes (BENCH_LATENCY_<TOOL> overrides it per tool)
+# BENCH_OUTPUT_LINES  lines printed per call (BENCH_OUTPUT_LINES_<TOOL> per tool)
+# BENCH_FAIL_RATE     probability that a call fails (BENCH_FAIL_RATE_<TOOL> per tool)
+# BENCH_SEED          seed of the failure draws; the same seed, arguments and attempt give the same outcome
+# BENCH_SPAWN_LOG     file that gets one "<tool> <call key>" line per call, for counting spawns and retries
+# BENCH_ROOT          workspace path, left out of the arguments a failure draw is based on
+# BENCH_SERVICES      JSON list of the service display names Get-Service knows about
+
+# Phase start lines as a real tem.bat -update prints them, before and after the deploy steps
+TEM_PHASES = [
+    "Acquiring TEM lock", "Loading software depot [software]", "Gopher is getting files",
+    "Number of features loaded: 960", "Beginning update", "Updating database:  full model deploy",
+    "Deploy Runner execution begins",
+]
+TEM_FINAL_PHASES = ["Executing tool: fake type preferences updater...", "Begin Task: Log auto-archive creation"]
+
+
+def setting(name, tool, default, cast):
+    value = os.environ.get(f"{name}_{tool.upper()}", os.environ.get(name))
+    return cast(value) if value not in (None, "") else default
+
+
+def call_key(tool, args):
+    """Identify a call by tool and arguments, without the workspace path so runs draw alike."""
+    key = " ".join(args).replace(os.environ.get("BENCH_ROOT", "\0"), "")
+    return hashlib.sha256(f"{tool}|{key}".encode("utf-8")).hexdigest()[:16]
+
+
+def log_spawn(tool, key):
+    """Append this call to BENCH_SPAWN_LOG and return how many times it was made before."""
+    spawn_log = os.environ.get("BENCH_SPAWN_LOG")
+    if not spawn_log:
+        return 0
+    attempt = 0
+    if os.path.exists(spawn_log):
+        with open(spawn_log, 'r', encoding='utf-8') as f:
+            attempt = sum(1 for line in f if line.split()[1:] == [key])
+    with open(spawn_log, 'a', encoding='utf-8') as f:
+        f.write(f"{tool} {key}\n")
+    return attempt
+
+
+def draw_failure(tool, args, attempt=0):
+    """A retried call draws again, so a failure can be transient like a real one."""
+    rate = setting("BENCH_FAIL_RATE", tool, 0.0, float)
+    if rate <= 0:
+        return False
+    key = " ".join(args).replace(os.environ.get("BENCH_ROOT", "\0"), "")
+    return random.Random(f"{os.environ.get('BENCH_SEED', '0')}|{tool}|{key}|{attempt}").random() < rate
+
+
+def emit(tool, lines, prefix):
+    out = sys.stdout
+    for i in range(lines):
+        out.write(f"{prefix} {tool} output line {i + 1} of {lines}\n")
+    out.flush()
+
+
+def option(args, name):
+    """Value of a -name=value argument, without quotes."""
+    for arg in args:
+        if arg.lower().startswith(f"-{name.lower()}="):
+            return arg.split("=", 1)[1].strip('"')
+    return None
+
+
+def run_tem(args, lines, fail):
+    steps = 5
+    chunk = max(1, lines // (len(TEM_PHASES) + steps + len(TEM_FINAL_PHASES)))
+    for phase in TEM_PHASES:
+        print(phase)
+        emit("tem", chunk, "INFO")
+    for step in range(1, steps + 1):
+        print(f"Step {step} of {steps} - {(step - 1) * 100 // steps}% Completed")
+        emit("tem", chunk, "INFO")
+    for phase in TEM_FINAL_PHASES:
+        print(phase)
+        emit("tem", chunk, "INFO")
+    if fail:
+        print("ERROR: simulated tem failure")
+        return 1
+    print("Operation successful")
+    return 0
+
+
+def run_preferences_manager(args, lines, fail):
+    emit("preferences_manager", lines, "INFO")
+    if fail:
+        print("ERROR: simulated preferences_manager failure", file=sys.stderr)
+        return 1
+    out_file = option(args, "out_file")
+    if option(args, "mode") == "export" and out_file:
+        with open(out_file, 'w', encoding='utf-8') as f:
+            f.write('<?xml version="1.0" encoding="ISO-8859-15"?>\n<preferences version="10.0"/>\n')
+    return 0
+
+
+def run_stylesheet_import(args, lines, fail):
+    input_file = option(args, "input")
+    with open(input_file, 'r', encoding='utf-8') as f:
+        datasets = [line.split(",")[0] for line in f if line.strip()]
+    for dataset in datasets:
+        print(f"Importing stylesheet dataset {dataset}")
+    emit("install_xml_stylesheet_datasets", lines, "INFO")
+    if fail:
+        print("ERROR: simulated import failure", file=sys.stderr)
+        return 1
+    return 0
+
+
+def run_awbuild(lines, fail):
+    emit("awbuild", lines, "INFO")
+    if fail:
+        print("ERROR: simulated awbuild failure", file=sys.stderr)
+        return 1
+    os.makedirs("out", exist_ok=True)
+    with open(os.path.join("out", "main.js"), 'w', encoding='utf-8') as f:
+        f.write("// built\n" * lines)
+    return 0
+
+
+def run_cmd(args):
+    command = " ".join(args[1:]) if args and args[0].lower() == "/c" else " ".join(args)
+    if command.rstrip('" ').endswith("set"):
+        # "<batch file> && set": print the environment the batch file would leave behind
+        env = dict(os.environ, TC_ROOT=os.environ.get("BENCH_TC_ROOT", ""), TC_DATA=os.environ.get("BENCH_TC_DATA", ""))
+        for key, value in sorted(env.items()):
+            print(f"{key}={value}")
+        return "cmd", 0
+    if "awbuild" in command.lower():
+        return "awbuild", None
+    return "cmd", 0
+
+
+def run_powershell(args, attempt):
+    script = " ".join(args)
+    services = json.loads(os.environ.get("BENCH_SERVICES", "[]"))
+    if "$waves" in script:
+        action = re.search(r"\$action = '(\w+)'", script).group(1)
+        target = "Running" if action == "start" else "Stopped"
+        before = "Stopped" if action == "start" else "Running"
+        wave_names = [re.findall(r"'((?:[^']|'')*)'", line) for line in re.findall(r"\$waves \+= ,@\((.*)\)", script)]
+        results = []
+        for wave, names in enumerate(wave_names, 1):
+            for name in (n.replace("''", "'") for n in names):
+                if name not in services:
+                    results.append({"display_name": name, "wave": wave, "name": None, "before": None, "action": "not_found", "after": None, "error": None})
+                elif draw_failure("powershell", [action, name], attempt):
+                    results.append({"display_name": name, "wave": wave, "name": service_name(name), "before": before, "action": "failed", "after": before, "error": "simulated failure"})
+                else:
+                    results.append({"display_name": name, "wave": wave, "name": service_name(name), "before": before, "action": action, "after": target, "error": None})
+        print(json.dumps(results))
+    elif "Get-Service |" in script:
+        print(json.dumps([{"Name": service_name(name), "DisplayName": name, "Status": "Stopped"} for name in services]))
+    elif ".Status" in script:
+        print("Stopped")
+    return 0
+
+
+def service_name(display_name):
+    return re.sub(r"\W", "", display_name)
+
+
+def main():
+    tool, args = sys.argv[1], sys.argv[2:]
+
+    exit_code = None
+    if tool == "cmd":
+        tool, exit_code = run_cmd(args)
+
+    attempt = log_spawn(tool, call_key(tool, args))
+
+    time.sleep(setting("BENCH_LATENCY", tool, 0.0, float))
+    if exit_code is not None:
+        return exit_code
+
+    lines = setting("BENCH_OUTPUT_LINES", tool, 10, int)
+    if tool == "powershell":
+        return run_powershell(args, attempt)
+    fail = draw_failure(tool, args, attempt)
+    if tool == "tem":
+        return run_tem(args, lines, fail)
+    if tool == "preferences_manager":
+        return run_preferences_manager(args, lines, fail)
+    if tool == "install_xml_stylesheet_datasets":
+        return run_stylesheet_import(args, lines, fail)
+    if tool == "awbuild":
+        return run_awbuild(lines, fail)
+    print(f"fake_tool.py: unknown tool {tool}", file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
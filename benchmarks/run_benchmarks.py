@@ -0,0 +1,296 @@
+import os
+import sys
+import json
+import time
+import shutil
+import zipfile
+import argparse
+import tempfile
+import statistics
+import subprocess
+from collections import Counter
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_TOOL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_tool.py")
+
+SIZES = {
+    "small": {"preference_files": 20, "preferences_per_file": 20, "stylesheets": 50, "aws2_files": 500, "services": 20, "tem_lines": 2000},
+    "medium": {"preference_files": 100, "preferences_per_file": 50, "stylesheets": 300, "aws2_files": 5000, "services": 60, "tem_lines": 20000},
+    "large": {"preference_files": 500, "preferences_per_file": 100, "stylesheets": 2000, "aws2_files": 30000, "services": 200, "tem_lines": 100000},
+}
+
+TEMPLATE = "bench"
+PWF_FILE = "bench.pwf"
+
+
+def write_wrapper(path, tool):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_TOOL}" {tool} "$@"\n')
+    os.chmod(path, 0o755)
+
+
+def write_preferences(folder, files, per_file):
+    os.makedirs(folder, exist_ok=True)
+    for i in range(files):
+        lines = ['<?xml version="1.0" encoding="ISO-8859-15"?>', '<preferences version="10.0">', f'  <category name="Bench{i % 5}">',
+                 '    <category_description>Benchmark preferences</category_description>']
+        for j in range(per_file):
+            lines += [f'    <preference name="BENCH_{i}_{j}" type="String" array="false" disabled="false" protectionScope="Site" envEnabled="false">',
+                      f'      <preference_description>Synthetic preference {j} of file {i}</preference_description>',
+                      f'      <context name="Teamcenter"><value>value_{i}_{j}</value></context>', '    </preference>']
+        lines += ['  </category>', '</preferences>']
+        with open(os.path.join(folder, f"preferences_{i:04d}.xml"), 'w', encoding='ISO-8859-15') as f:
+            f.write("\n".join(lines) + "\n")
+
+
+def write_stylesheets(folder, count):
+    for i in range(count):
+        sub_folder = os.path.join(folder, f"group_{i % 10}")
+        os.makedirs(sub_folder, exist_ok=True)
+        rows = "".join(f'<property name="bench_prop_{j}"/>' for j in range(40))
+        with open(os.path.join(sub_folder, f"Bench_Stylesheet_{i:04d}.xml"), 'w', encoding='utf-8') as f:
+            f.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<rendering><page title="Bench {i}">{rows}</page></rendering>\n')
+
+
+def write_aws2_tree(folder, count):
+    for i in range(count):
+        sub_folder = os.path.join(folder, "src", f"module_{i % 50}", f"part_{i % 7}")
+        os.makedirs(sub_folder, exist_ok=True)
+        with open(os.path.join(sub_folder, f"file_{i:05d}.js"), 'w', encoding='utf-8') as f:
+            f.write(f"export const value{i} = {i};\n" * 20)
+    with open(os.path.join(folder, "awbuild.cmd"), 'w', encoding='utf-8') as f:
+        f.write("@echo off\r\nrem replaced by the fake awbuild\r\n")
+
+
+def write_package(folder, lines):
+    """A full_update package laid out as bmide_generate_package writes it."""
+    os.makedirs(os.path.join(folder, "tem_contributions"), exist_ok=True)
+    os.makedirs(os.path.join(folder, "artifacts"), exist_ok=True)
+    with open(os.path.join(folder, "tem_contributions", f"feature_{TEMPLATE}.xml"), 'w', encoding='utf-8') as f:
+        f.write(f'<?xml version="1.0"?>\n<feature name="{TEMPLATE}"/>\n')
+    with open(os.path.join(folder, f"media_teamcenter_{TEMPLATE}.xml"), 'w', encoding='utf-8') as f:
+        f.write(f'<?xml version="1.0"?>\n<media name="{TEMPLATE}"/>\n')
+    for suffix in ("template", "install", "icons", "project_tc2412"):
+        with zipfile.ZipFile(os.path.join(folder, "artifacts", f"{TEMPLATE}_{suffix}.zip"), 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(f"{suffix}.txt", "bench payload\n" * lines)
+
+
+def build_workspace(root, size):
+    """Create a fake TC_ROOT, tool wrappers and the synthetic input trees under root."""
+    tc_root = os.path.join(root, "tc_root")
+    fake_bin = os.path.join(root, "fake_bin")
+    write_wrapper(os.path.join(fake_bin, "cmd"), "cmd")
+    write_wrapper(os.path.join(fake_bin, "powershell"), "powershell")
+    write_wrapper(os.path.join(tc_root, "bin", "preferences_manager.exe"), "preferences_manager")
+    write_wrapper(os.path.join(tc_root, "bin", "install_xml_stylesheet_datasets.exe"), "install_xml_stylesheet_datasets")
+    write_wrapper(os.path.join(tc_root, "install", "tem.bat"), "tem")
+    os.makedirs(os.path.join(tc_root, "security"))
+    with open(os.path.join(tc_root, "security", PWF_FILE), 'w', encoding='utf-8') as f:
+        f.write("benchmark\n")
+    os.makedirs(os.path.join(tc_root, "aws2", "stage"))
+    os.makedirs(os.path.join(root, "tc_data", "model"))
+    os.makedirs(os.path.join(root, "temp"))
+    with open(os.path.join(root, "tc_config.bat"), 'w', encoding='utf-8') as f:
+        f.write("@echo off\r\n")
+
+    write_preferences(os.path.join(root, "preferences"), size["preference_files"], size["preferences_per_file"])
+    write_stylesheets(os.path.join(root, "stylesheets"), size["stylesheets"])
+    write_aws2_tree(os.path.join(root, "aws2_src"), size["aws2_files"])
+    write_package(os.path.join(root, "package"), 1000)
+    os.makedirs(os.path.join(root, "fullkit", "tc"))
+    write_wrapper(os.path.join(root, "fullkit", "tem.bat"), "tem")
+
+    services = [f"Bench Service {i:03d}" for i in range(size["services"])]
+    with open(os.path.join(root, "services.txt"), 'w', encoding='utf-8') as f:
+        f.write("\n".join(services) + "\n")
+    # Every tenth service depends on the first one, so the batch runs in two waves
+    with open(os.path.join(root, "services_graph.json"), 'w', encoding='utf-8') as f:
+        json.dump({name: [services[0]] for name in services[10::10]}, f)
+    return services
+
+
+def scenario_commands(root):
+    """{scenario: (warm-up command or None, measured command)}; commands run in root."""
+    py = sys.executable
+    tc_bat = os.path.join(root, "tc_config.bat")
+    preferences = [py, os.path.join(REPO_DIR, "prefrencesDeploymentScript.py"), "preferences_manager.exe", "-u", "infodba", "-g", "dba",
+                   "-scope", "SITE", "-mode", "import", "-action", "OVERRIDE", "-pf", PWF_FILE, "--folder", os.path.join(root, "preferences")]
+    stylesheet = [py, os.path.join(REPO_DIR, "stylesheet.py"), "-target-path", os.path.join(root, "stylesheets"), "-pwf-file", PWF_FILE,
+                  "-install-user", "infodba", "-install-group", "dba", "-tc-bat", tc_bat]
+    awc = [py, os.path.join(REPO_DIR, "awcDeploymentScript.py"), "-target_path", os.path.join(root, "aws2_src"), "-tc_bat", tc_bat]
+    return {
+        "preferences": (None, preferences),
+        "preferences_batch": (None, preferences + ["--batch"]),
+        "stylesheet_full": (None, stylesheet + ["-full"]),
+        "stylesheet_unchanged": (stylesheet, stylesheet),
+        "stylesheet_sharded": (None, stylesheet + ["-full", "-shards", "4", "-max-parallel", "4", "-retries", "2"]),
+        "awc_build": (None, awc),
+        "awc_unchanged": (awc, awc),
+        "bmide_deploy": (None, [py, os.path.join(REPO_DIR, "Bmide_generate_deploy.py"), "-tc_bat", tc_bat, "-template", TEMPLATE,
+                                "-pf_file", PWF_FILE, "-version", "1.0", "-fullkit_path", os.path.join(root, "fullkit"),
+                                "--path", os.path.join(root, "package")]),
+        "services_start": (None, [py, os.path.join(REPO_DIR, "list_services.py"), os.path.join(root, "services.txt"), "start",
+                                  "--graph", os.path.join(root, "services_graph.json")]),
+        "services_inventory": (None, [py, os.path.join(REPO_DIR, "all_services.py"), "--refresh"]),
+    }
+
+
+def bench_env(root, services, args, size):
+    env = dict(os.environ)
+    env.update({
+        "PATH": os.path.join(root, "fake_bin") + os.pathsep + env.get("PATH", ""),
+        "TEMP": os.path.join(root, "temp"),
+        "EXECUTE_SET_TC_CONFIG_BAT": os.path.join(root, "tc_config.bat"),
+        "DEPLOY_TRACE_FILE": os.path.join(root, "deploy_trace.jsonl"),
+        "BENCH_ROOT": root,
+        "BENCH_TC_ROOT": os.path.join(root, "tc_root"),
+        "BENCH_TC_DATA": os.path.join(root, "tc_data"),
+        "BENCH_SERVICES": json.dumps(services),
+        "BENCH_SPAWN_LOG": os.path.join(root, "spawns.log"),
+        "BENCH_LATENCY": str(args.latency),
+        "BENCH_OUTPUT_LINES": str(args.output_lines),
+        "BENCH_OUTPUT_LINES_TEM": str(size["tem_lines"]),
+        "BENCH_FAIL_RATE": str(args.fail_rate),
+        "BENCH_SEED": str(args.seed),
+    })
+    for key in ("DEPLOY_TRACE_RUN", "DEPLOY_TRACE_PARENT"):
+        env.pop(key, None)
+    return env
+
+
+def measure(command, cwd, env, output_file):
+    """Run command and return (exit code, wall seconds, peak RSS in MB of it and its children)."""
+    with open(output_file, 'ab') as out:
+        start = time.monotonic()
+        process = subprocess.Popen(command, cwd=cwd, env=env, stdout=out, stderr=subprocess.STDOUT)
+        # wait4 reports the resource usage of this child alone, including the tools it waited for
+        _, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.monotonic() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is in kilobytes on Linux
+    return process.returncode, elapsed, usage.ru_maxrss / 1024
+
+
+def run_scenario(name, size, args):
+    runs = []
+    for _ in range(args.repeat):
+        # A fresh workspace per run, so every run starts from the same state
+        root = tempfile.mkdtemp(prefix=f"bench_{name}_")
+        keep = False
+        try:
+            services = build_workspace(root, size)
+            env = bench_env(root, services, args, size)
+            warm_up, command = scenario_commands(root)[name]
+            output_file = os.path.join(root, "output.log")
+            if warm_up:
+                measure(warm_up, root, env, output_file)
+                if os.path.exists(env["BENCH_SPAWN_LOG"]):
+                    os.remove(env["BENCH_SPAWN_LOG"])
+            exit_code, elapsed, rss_mb = measure(command, root, env, output_file)
+            spawns = Counter()
+            if os.path.exists(env["BENCH_SPAWN_LOG"]):
+                with open(env["BENCH_SPAWN_LOG"], 'r', encoding='utf-8') as f:
+                    spawns.update(line.split()[0] for line in f if line.strip())
+            runs.append({"exit_code": exit_code, "seconds": round(elapsed, 3), "peak_rss_mb": round(rss_mb, 1), "spawns": dict(spawns)})
+            keep = args.keep_failed and exit_code != 0
+            if keep:
+                print(f"{name}: exit code {exit_code}, workspace kept at {root}")
+        finally:
+            if not keep:
+                shutil.rmtree(root, ignore_errors=True)
+
+    return {
+        "seconds_median": round(statistics.median(r["seconds"] for r in runs), 3),
+        "seconds_min": min(r["seconds"] for r in runs),
+        "peak_rss_mb": max(r["peak_rss_mb"] for r in runs),
+        "spawns": runs[-1]["spawns"],
+        "spawn_total": sum(runs[-1]["spawns"].values()),
+        "exit_codes": sorted({r["exit_code"] for r in runs}),
+        "runs": runs,
+    }
+
+
+def print_report(results):
+    width = max(len(name) for name in results)
+    print(f"{'Scenario':<{width}}  {'Median (s)':>10}  {'Min (s)':>8}  {'Peak RSS (MB)':>13}  {'Spawns':>6}  {'Exit':>5}  Spawns by tool")
+    for name, result in results.items():
+        by_tool = ", ".join(f"{tool}={count}" for tool, count in sorted(result["spawns"].items()))
+        exit_codes = ",".join(str(code) for code in result["exit_codes"])
+        print(f"{name:<{width}}  {result['seconds_median']:>10.3f}  {result['seconds_min']:>8.3f}  {result['peak_rss_mb']:>13.1f}  "
+              f"{result['spawn_total']:>6}  {exit_codes:>5}  {by_tool}")
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Return the regressions against a baseline report: more spawns, or time/RSS beyond tolerance."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        if result["spawn_total"] > base["spawn_total"]:
+            regressions.append(f"{name}: {result['spawn_total']} spawns, baseline {base['spawn_total']}")
+        if result["seconds_median"] > base["seconds_median"] * (1 + tolerance):
+            regressions.append(f"{name}: {result['seconds_median']:.3f}s, baseline {base['seconds_median']:.3f}s")
+        if result["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{name}: {result['peak_rss_mb']:.1f} MB peak RSS, baseline {base['peak_rss_mb']:.1f} MB")
+        if result["exit_codes"] != base["exit_codes"]:
+            regressions.append(f"{name}: exit codes {result['exit_codes']}, baseline {base['exit_codes']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the deploy scripts against simulated Teamcenter tools (Linux only).")
+    parser.add_argument("--size", choices=sorted(SIZES), default="small", help="Size of the generated preference, stylesheet and aws2 trees")
+    parser.add_argument("--scenarios", nargs="*", help="Scenarios to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scenario; the median time is reported")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds every simulated tool call takes")
+    parser.add_argument("--output-lines", type=int, default=50, help="Lines every simulated tool call prints (tem prints more, see --size)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Probability that a simulated tool call fails")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the simulated failures")
+    parser.add_argument("--json", dest="json_file", help="Write the results to this JSON file (usable as --baseline later)")
+    parser.add_argument("--baseline", help="Results of an earlier run; exit 1 on spawn, time or RSS regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative increase of time and RSS against the baseline")
+    parser.add_argument("--keep-failed", action="store_true", help="Keep the workspace of runs that exited with an error")
+    args = parser.parse_args()
+
+    if not hasattr(os, "wait4"):
+        print("The benchmarks need os.wait4 and the fake tools need /bin/sh; run them on Linux.")
+        sys.exit(1)
+
+    size = SIZES[args.size]
+    names = args.scenarios or list(scenario_commands(""))
+    unknown = [name for name in names if name not in scenario_commands("")]
+    if unknown:
+        print(f"Unknown scenarios: {unknown}")
+        sys.exit(1)
+
+    results = {}
+    for name in names:
+        results[name] = run_scenario(name, size, args)
+        print(f"{name}: {results[name]['seconds_median']:.3f}s, {results[name]['spawn_total']} spawns")
+    print()
+    print_report(results)
+
+    report = {
+        "size": args.size,
+        "settings": {"latency": args.latency, "output_lines": args.output_lines, "fail_rate": args.fail_rate, "seed": args.seed, "repeat": args.repeat},
+        "python": sys.version.split()[0],
+        "scenarios": results,
+    }
+    if args.json_file:
+        with open(args.json_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+from datetime import datetime
+
+from hash_utils import DEFAULT_WORKERS, walk_tree, hash_files, skip_paths_filter
+from tree_sync import sync_tree
+
+
+def merkle_hash(root_dir, skip_paths=(), workers=DEFAULT_WORKERS):
+    """Hash a directory tree: each directory hashes the sorted names and hashes of its children.
+
+    skip_paths are relative paths (e.g. build output directories) left out of the hash.
+    """
+    files, dirs = walk_tree(root_dir, skip_paths_filter(skip_paths))
+    file_entries, _ = hash_files(root_dir, files, workers=workers)
+
+    dir_children = {rel_dir: ([], []) for rel_dir in dirs | {""}}
+    for rel_path in sorted(dirs):
+        parent, _, name = rel_path.rpartition("/")
+        dir_children[parent][0].append(name)
+    for rel_path in sorted(files):
+        parent, _, name = rel_path.rpartition("/")
+        dir_children[parent][1].append(name)
+
+    # Children sort after their parent, so walking in reverse computes leaves first
+    dir_hashes = {}
+    for rel_root in sorted(dir_children, reverse=True):
+        child_dirs, child_files = dir_children[rel_root]
+        prefix = rel_root + "/" if rel_root else ""
+        digest = hashlib.sha256()
+        for name in child_dirs:
+            digest.update(f"D {name} {dir_hashes[prefix + name]}\n".encode("utf-8"))
+        for name in child_files:
+            digest.update(f"F {name} {file_entries[prefix + name]['sha256']}\n".encode("utf-8"))
+        dir_hashes[rel_root] = digest.hexdigest()
+
+    return dir_hashes[""]
+
+
+def restore_outputs(cache_dir, key, work_dir, output_dirs):
+    """Copy cached outputs for key into work_dir. Returns False on a cache miss."""
+    entry_dir = os.path.join(cache_dir, key)
+    if not os.path.isfile(os.path.join(entry_dir, "meta.json")):
+        return False
+
+    for output_dir in output_dirs:
+        cached = os.path.join(entry_dir, output_dir)
+        if os.path.isdir(cached):
+            sync_tree(cached, os.path.join(work_dir, output_dir))
+    # Touch the entry so pruning keeps recently used builds
+    os.utime(os.path.join(entry_dir, "meta.json"))
+    return True
+
+
+def store_outputs(cache_dir, key, work_dir, output_dirs):
+    """Save output_dirs of a successful build under key."""
+    entry_dir = os.path.join(cache_dir, key)
+    tmp_dir = f"{entry_dir}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+
+    stored = []
+    for output_dir in output_dirs:
+        source = os.path.join(work_dir, output_dir)
+        if os.path.isdir(source):
+            shutil.copytree(source, os.path.join(tmp_dir, output_dir))
+            stored.append(output_dir)
+        else:
+            logging.warning(f"Build output directory not found, not cached: {source}")
+
+    with open(os.path.join(tmp_dir, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump({"key": key, "outputs": stored, "created": datetime.now().isoformat()}, f, indent=2)
+
+    if os.path.exists(entry_dir):
+        shutil.rmtree(entry_dir)
+    os.replace(tmp_dir, entry_dir)
+    logging.info(f"Cached build outputs {stored} under {entry_dir}")
+
+
+def prune_cache(cache_dir, keep):
+    """Keep only the `keep` most recently used cache entries."""
+    if keep <= 0 or not os.path.isdir(cache_dir):
+        return
+    entries = []
+    for name in os.listdir(cache_dir):
+        meta = os.path.join(cache_dir, name, "meta.json")
+        if os.path.isfile(meta):
+            entries.append((os.path.getmtime(meta), os.path.join(cache_dir, name)))
+    for _, entry_dir in sorted(entries, reverse=True)[keep:]:
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        logging.info(f"Pruned build cache entry: {entry_dir}")
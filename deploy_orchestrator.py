@@ -0,0 +1,193 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from process_runner import run_streaming, log_tail
+from tracing import span, child_env, run_traced
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def setup_logger():
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    log_file = os.path.join(os.getcwd(), f"deploy_{timestamp}.log")
+    logging.basicConfig(
+        filename=log_file,
+        level=logging.INFO,
+        format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s'
+    )
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    logging.getLogger().addHandler(console_handler)
+    return log_file
+
+
+def load_spec(spec_file):
+    """Read the run spec and fill {variables} into the stage commands.
+
+    The spec is {"vars": {...}, "stages": {name: {"command": [...], "needs": [...], "cwd": ..., "env": {...}}}}.
+    {python} and {repo} are always available as variables; env adds environment variables.
+    """
+    with open(spec_file, 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+
+    variables = {"python": sys.executable, "repo": SCRIPT_DIR, **spec.get("vars", {})}
+    stages = {}
+    for name, stage in spec["stages"].items():
+        stages[name] = {
+            "command": [arg.format_map(variables) for arg in stage["command"]],
+            "needs": stage.get("needs", []),
+            "cwd": stage.get("cwd", "{repo}").format_map(variables),
+            "env": {key: value.format_map(variables) for key, value in stage.get("env", {}).items()},
+        }
+    return stages
+
+
+def validate_stages(stages):
+    """Return a list of problems: unknown dependencies and dependency cycles."""
+    problems = [
+        f"Stage '{name}' needs unknown stage '{need}'"
+        for name, stage in stages.items() for need in stage["needs"] if need not in stages
+    ]
+    if problems:
+        return problems
+
+    remaining = {name: set(stage["needs"]) for name, stage in stages.items()}
+    while remaining:
+        ready = [name for name, needs in remaining.items() if not needs]
+        if not ready:
+            return [f"Dependency cycle between stages: {sorted(remaining)}"]
+        for name in ready:
+            del remaining[name]
+        for needs in remaining.values():
+            needs.difference_update(ready)
+    return []
+
+
+def run_stage(name, stage):
+    logging.info(f"Stage '{name}' started: {' '.join(stage['command'])}")
+    start = time.monotonic()
+    with span(name) as s:
+        # child_env lets the stage script record its own spans under this one
+        result = run_streaming(stage["command"], env=child_env({**os.environ, **stage["env"]}), cwd=stage["cwd"], shell=False, label=name)
+        s.set(exit_code=result.returncode)
+    elapsed = time.monotonic() - start
+    if result.returncode != 0:
+        logging.error(f"Stage '{name}' failed with return code {result.returncode} after {elapsed:.1f}s")
+        log_tail(result)
+    else:
+        logging.info(f"Stage '{name}' succeeded in {elapsed:.1f}s")
+    return result.returncode == 0
+
+
+def run_stages(stages, max_parallel):
+    """Run every stage as soon as the stages it needs have succeeded.
+
+    A stage whose dependency failed or was skipped is skipped. Returns
+    {name: {"status", "start", "duration"}} with times relative to the run start.
+    """
+    run_start = time.monotonic()
+    report = {name: {"status": "pending", "start": None, "duration": None} for name in stages}
+    running = {}
+
+    def finished(name):
+        return report[name]["status"] in ("succeeded", "failed", "skipped")
+
+    with ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="stage") as executor:
+        while True:
+            for name, stage in stages.items():
+                if report[name]["status"] != "pending":
+                    continue
+                if any(report[need]["status"] in ("failed", "skipped") for need in stage["needs"]):
+                    report[name]["status"] = "skipped"
+                    logging.warning(f"Stage '{name}' skipped: a stage it needs did not succeed")
+                elif all(report[need]["status"] == "succeeded" for need in stage["needs"]):
+                    report[name].update(status="running", start=round(time.monotonic() - run_start, 1))
+                    running[executor.submit(run_stage, name, stage)] = name
+
+            # Skipping can unblock further skips, so only wait when nothing changed
+            if all(finished(name) for name in stages):
+                break
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    ok = future.result()
+                except Exception as e:
+                    logging.error(f"Stage '{name}' could not be run: {e}")
+                    ok = False
+                report[name]["status"] = "succeeded" if ok else "failed"
+                report[name]["duration"] = round(time.monotonic() - run_start - report[name]["start"], 1)
+    return report
+
+
+def critical_path(stages, report):
+    """Return (stage names, seconds) of the longest chain of dependent stages that ran."""
+    longest = {}
+
+    def visit(name):
+        if name not in longest:
+            best = max((visit(need) for need in stages[name]["needs"]), key=lambda p: p[1], default=([], 0.0))
+            longest[name] = (best[0] + [name], best[1] + (report[name]["duration"] or 0.0))
+        return longest[name]
+
+    return max((visit(name) for name in stages), key=lambda p: p[1], default=([], 0.0))
+
+
+def log_report(stages, report, elapsed):
+    lines = [f"{'Stage':<20} {'Status':<10} {'Start (s)':>10} {'Duration (s)':>13}"]
+    for name, entry in report.items():
+        start = "-" if entry["start"] is None else f"{entry['start']:.1f}"
+        duration = "-" if entry["duration"] is None else f"{entry['duration']:.1f}"
+        lines.append(f"{name:<20} {entry['status']:<10} {start:>10} {duration:>13}")
+    path, path_seconds = critical_path(stages, report)
+    total = sum(entry["duration"] or 0.0 for entry in report.values())
+    lines.append(f"Wall clock {elapsed:.1f}s, sum of stages {total:.1f}s, critical path {path_seconds:.1f}s ({' -> '.join(path)})")
+    logging.info("Deployment summary:\n" + "\n".join(lines))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the deployment stages of a run spec, in parallel where they do not depend on each other.")
+    parser.add_argument("spec", help="JSON run spec (see deploy_spec.json)")
+    parser.add_argument("--max-parallel", type=int, default=4, help="Maximum number of stages running at once")
+    parser.add_argument("--only", nargs="*", help="Run only these stages (their dependencies are assumed done)")
+    parser.add_argument("--report", help="Write the per-stage status and timings to this JSON file")
+    args = parser.parse_args()
+
+    setup_logger()
+    stages = load_spec(args.spec)
+    if args.only:
+        unknown = [name for name in args.only if name not in stages]
+        if unknown:
+            logging.error(f"Unknown stages: {unknown}")
+            sys.exit(1)
+        stages = {name: {**stages[name], "needs": [n for n in stages[name]["needs"] if n in args.only]} for name in args.only}
+
+    problems = validate_stages(stages)
+    for problem in problems:
+        logging.error(problem)
+    if problems:
+        sys.exit(1)
+
+    start = time.monotonic()
+    report = run_stages(stages, args.max_parallel)
+    elapsed = time.monotonic() - start
+    log_report(stages, report, elapsed)
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({"elapsed": round(elapsed, 1), "stages": report}, f, indent=2)
+
+    sys.exit(0 if all(entry["status"] == "succeeded" for entry in report.values()) else 1)
+
+
+if __name__ == "__main__":
+    run_traced("deploy_orchestrator", main)
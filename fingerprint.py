@@ -0,0 +1,30 @@
+import os
+import json
+import hashlib
+
+from hash_utils import DEFAULT_WORKERS, walk_tree, hash_files, skip_paths_filter
+
+
+def fingerprint_trees(trees, previous_files=None, extra=None, workers=DEFAULT_WORKERS):
+    """Fingerprint the contents of several directory trees.
+
+    trees maps a label to (root_dir, skip_paths). Files whose size and mtime match
+    previous_files (the entries returned by an earlier call) are not read again.
+    extra is any JSON-serialisable value that should also invalidate the fingerprint.
+    Returns (fingerprint, file entries keyed "label/relative path").
+    """
+    previous_files = previous_files or {}
+    entries = {}
+    for label, (root_dir, skip_paths) in trees.items():
+        if not os.path.isdir(root_dir):
+            continue
+        prefix = label + "/"
+        files, _ = walk_tree(root_dir, skip_paths_filter(skip_paths))
+        previous = {key[len(prefix):]: entry for key, entry in previous_files.items() if key.startswith(prefix)}
+        tree_entries, _ = hash_files(root_dir, files, previous, workers)
+        entries.update((prefix + rel_path, entry) for rel_path, entry in tree_entries.items())
+
+    digest = hashlib.sha256(json.dumps(extra, sort_keys=True).encode("utf-8"))
+    for key in sorted(entries):
+        digest.update(f"{key} {entries[key]['sha256']}\n".encode("utf-8"))
+    return digest.hexdigest(), entries
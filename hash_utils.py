@@ -0,0 +1,72 @@
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNK_SIZE = 1024 * 1024
+# Hashing and copying wait on the disk more than on the CPU, so use more threads than cores
+DEFAULT_WORKERS = min(16, (os.cpu_count() or 1) * 2)
+
+
+def sha256_file(file_path, chunk_size=CHUNK_SIZE):
+    """Return the hex SHA-256 digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sha256_text(text):
+    """Return the hex SHA-256 digest of a string."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def walk_tree(root_dir, skip=None):
+    """Return ({relative posix file path: os.stat_result}, {relative posix dir path}) for a tree.
+
+    skip, if given, is called with each relative path; directories it returns True
+    for are not descended into, files are left out.
+    """
+    files = {}
+    dirs = set()
+    for root, dirnames, filenames in os.walk(root_dir):
+        rel_root = os.path.relpath(root, root_dir).replace(os.sep, "/")
+        prefix = "" if rel_root == "." else rel_root + "/"
+        dirnames[:] = sorted(d for d in dirnames if not (skip and skip(prefix + d)))
+        dirs.update(prefix + d for d in dirnames)
+        for filename in filenames:
+            if not (skip and skip(prefix + filename)):
+                files[prefix + filename] = os.stat(os.path.join(root, filename))
+    return files, dirs
+
+
+def skip_paths_filter(skip_paths):
+    """Return a walk_tree skip callable leaving out the given relative paths (and their subtrees)."""
+    skip_paths = {p.replace("\\", "/").strip("/") for p in skip_paths}
+    return lambda rel_path: rel_path in skip_paths
+
+
+def hash_files(root_dir, files, previous=None, workers=DEFAULT_WORKERS):
+    """Hash the files {relative path: stat} of a tree into {relative path: {size, mtime_ns, sha256}}.
+
+    Entries of previous (an earlier result) whose size and mtime still match are reused
+    without reading the file. Returns (entries, number of files actually hashed).
+    """
+    previous = previous or {}
+    entries = {}
+    to_hash = []
+    for rel_path, stat in files.items():
+        old = previous.get(rel_path)
+        if old and old["size"] == stat.st_size and old["mtime_ns"] == stat.st_mtime_ns:
+            entries[rel_path] = dict(old)
+        else:
+            to_hash.append(rel_path)
+
+    def hash_one(rel_path):
+        return sha256_file(os.path.join(root_dir, *rel_path.split("/")))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for rel_path, sha256 in zip(to_hash, executor.map(hash_one, to_hash)):
+            stat = files[rel_path]
+            entries[rel_path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+    return entries, len(to_hash)
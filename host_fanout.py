@@ -0,0 +1,177 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+
+from list_services import (
+    build_batch_script, compute_waves, compute_blockers, load_dependency_graph, resolve_graph, ps_quote, GRAPH_FILE,
+)
+
+HOST_MAPPING_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "host_mapping.json")
+SERVICES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "services.txt")
+
+# How many hosts of an environment are handled at once; prod is kept lower on purpose
+ENV_CONCURRENCY = {"dev": 4, "prod": 2}
+DEFAULT_CONCURRENCY = 4
+DEFAULT_HOST_TIMEOUT = 600
+
+
+async def run_powershell(args):
+    """Run powershell with args and return its stdout; raise RuntimeError on failure."""
+    process = await asyncio.create_subprocess_exec(
+        "powershell", "-NoProfile", *args,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        stdout, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        # The host timed out; do not leave the PowerShell session running
+        process.kill()
+        await process.wait()
+        raise
+    if process.returncode != 0:
+        raise RuntimeError(f"powershell exited with {process.returncode}: {stderr.decode(errors='replace').strip()}")
+    return stdout.decode(errors="replace")
+
+
+async def remote_transport(host, ps_script):
+    """Run the script on host through PowerShell remoting."""
+    command = f"Invoke-Command -ComputerName {ps_quote(host)} -ScriptBlock {{ {ps_script} }}"
+    return await run_powershell(["-Command", command])
+
+
+async def local_transport(host, ps_script):
+    """Run the script on this machine whatever the host; a stand-in for testing the fan-out."""
+    return await run_powershell(["-Command", ps_script])
+
+
+# A transport is a coroutine function (host, ps_script) returning the script's stdout
+TRANSPORTS = {"remote": remote_transport, "local": local_transport}
+
+
+async def run_on_host(host, transport, ps_script, timeout, semaphore):
+    async with semaphore:
+        logging.info(f"[{host}] started")
+        start = time.monotonic()
+        outcome = {"host": host, "status": "ok", "error": None, "results": []}
+        try:
+            outcome["results"] = json.loads(await asyncio.wait_for(transport(host, ps_script), timeout))
+        except asyncio.TimeoutError:
+            outcome.update(status="timeout", error=f"No result within {timeout} seconds")
+        except (OSError, RuntimeError, ValueError) as e:
+            outcome.update(status="error", error=str(e))
+        outcome["seconds"] = round(time.monotonic() - start, 1)
+        logging.info(f"[{host}] {outcome['status']} after {outcome['seconds']}s")
+        return outcome
+
+
+async def fan_out(hosts, transport, ps_script, concurrency, timeout):
+    """Run ps_script on every host, at most `concurrency` at a time; results keep host order."""
+    semaphore = asyncio.Semaphore(concurrency)
+    return await asyncio.gather(*(run_on_host(host, transport, ps_script, timeout, semaphore) for host in hosts))
+
+
+def build_host_script(services, graph, action, service_timeout):
+    """Return the waves and the PowerShell script every host runs; raise ValueError on a dependency cycle.
+
+    graph holds display name patterns (see services_graph.json), resolved against services.
+    """
+    graph = resolve_graph(graph, services)
+    waves = compute_waves(services, graph)
+    if action == "stop":
+        waves.reverse()
+    # Each host enumerates its own services: the local inventory says nothing about remote machines
+    return waves, build_batch_script(waves, action, None, compute_blockers(services, graph, action), service_timeout)
+
+
+def build_matrix(outcomes, services):
+    """Return {service: {host: cell}} where a cell is the final status or what went wrong."""
+    matrix = {service: {} for service in services}
+    for outcome in outcomes:
+        by_service = {entry["display_name"]: entry for entry in outcome["results"]}
+        for service in services:
+            entry = by_service.get(service)
+            if outcome["status"] != "ok":
+                cell = outcome["status"].upper()
+            elif entry is None or entry["action"] == "not_found":
+                cell = "n/a"
+            elif entry["action"] in ("failed", "blocked"):
+                cell = entry["action"].upper()
+            else:
+                cell = entry["after"]
+            matrix[service][outcome["host"]] = cell
+    return matrix
+
+
+def log_matrix(matrix, hosts):
+    width = max([len(s) for s in matrix] + [7])
+    lines = [f"{'Service':<{width}}  " + "  ".join(f"{h:<15}" for h in hosts)]
+    for service, cells in matrix.items():
+        lines.append(f"{service:<{width}}  " + "  ".join(f"{cells[h]:<15}" for h in hosts))
+    logging.info("Result matrix:\n" + "\n".join(lines))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Start or stop the Teamcenter services on every host of an environment at once.")
+    parser.add_argument("environment", help="Environment key in host_mapping.json, e.g. dev or prod")
+    parser.add_argument("action", type=str.lower, choices=["start", "stop"], help="Action to perform")
+    parser.add_argument("--services", default=SERVICES_FILE, help="File with one service display name per line")
+    parser.add_argument("--host-mapping", default=HOST_MAPPING_FILE, help="JSON file mapping environments to host names")
+    parser.add_argument("--graph", default=GRAPH_FILE, help="Service dependency graph (see list_services.py)")
+    parser.add_argument("--concurrency", type=int, help="Hosts handled at once (default depends on the environment)")
+    parser.add_argument("--timeout", type=int, default=DEFAULT_HOST_TIMEOUT, help="Seconds allowed per host")
+    parser.add_argument("--service-timeout", type=int, default=120, help="Seconds to wait for each service to reach its new status")
+    parser.add_argument("--transport", choices=sorted(TRANSPORTS), default="remote", help="How the script reaches the hosts")
+    parser.add_argument("--json", dest="json_file", help="Write the per-host results and the matrix to this JSON file")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+
+    with open(args.host_mapping, 'r', encoding='utf-8') as f:
+        hosts = json.load(f).get(args.environment)
+    if not hosts:
+        logging.error(f"No hosts configured for environment '{args.environment}' in {args.host_mapping}")
+        sys.exit(1)
+    with open(args.services, 'r', encoding='utf-8') as f:
+        services = [line.strip() for line in f if line.strip()]
+
+    try:
+        waves, ps_script = build_host_script(services, load_dependency_graph(args.graph), args.action, args.service_timeout)
+    except ValueError as e:
+        logging.error(str(e))
+        sys.exit(1)
+    for number, wave in enumerate(waves, 1):
+        logging.info(f"Wave {number}: {', '.join(wave)}")
+
+    concurrency = args.concurrency or ENV_CONCURRENCY.get(args.environment, DEFAULT_CONCURRENCY)
+    logging.info(f"{args.action.capitalize()} {len(services)} services on {len(hosts)} {args.environment} hosts, {concurrency} at a time")
+
+    start = time.monotonic()
+    outcomes = asyncio.run(fan_out(hosts, TRANSPORTS[args.transport], ps_script, concurrency, args.timeout))
+    for outcome in outcomes:
+        if outcome["error"]:
+            logging.error(f"[{outcome['host']}] {outcome['error']}")
+
+    matrix = build_matrix(outcomes, services)
+    log_matrix(matrix, hosts)
+    logging.info(f"Finished in {time.monotonic() - start:.1f}s")
+
+    if args.json_file:
+        with open(args.json_file, 'w', encoding='utf-8') as f:
+            json.dump({"environment": args.environment, "action": args.action, "hosts": outcomes, "matrix": matrix}, f, indent=2)
+
+    failed = any(o["status"] != "ok" for o in outcomes) or any(
+        cell in ("FAILED", "BLOCKED") for cells in matrix.values() for cell in cells.values()
+    )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
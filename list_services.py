@@ -1,16 +1,32 @@
 import subprocess
 import sys
 import os
+import json
+import fnmatch
+import argparse
 
-def get_service_name_from_display(display_name):
-    """Resolve internal service name from display name using PowerShell."""
-    ps_script = f"""
-    $svc = Get-Service | Where-Object {{ $_.DisplayName -eq "{display_name}" }}
-    if ($svc) {{ $svc.Name }} else {{ "NOT_FOUND" }}
+from all_services import load_inventory, DEFAULT_TTL
+
+# Start order of the Teamcenter services; see services_graph.json
+GRAPH_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "services_graph.json")
+
+def resolve_service_names(display_names, ttl=DEFAULT_TTL):
+    """Map display names to internal service names using the cached service inventory.
+
+    Names not found are left out. A service installed after the snapshot was taken
+    is found once the snapshot is older than ttl seconds.
     """
-    result = subprocess.run(["powershell", "-Command", ps_script],
-                            capture_output=True, text=True)
-    return result.stdout.strip()
+    try:
+        services = load_inventory(ttl)
+    except (subprocess.CalledProcessError, ValueError) as e:
+        print(f"[ERROR] Could not read the service inventory: {e}")
+        sys.exit(1)
+    by_display_name = {s["DisplayName"].lower(): s["Name"] for s in services}
+    return {name: by_display_name[name.lower()] for name in display_names if name.lower() in by_display_name}
+
+def get_service_name_from_display(display_name, ttl=DEFAULT_TTL):
+    """Resolve internal service name from display name using the service inventory."""
+    return resolve_service_names([display_name], ttl).get(display_name, "NOT_FOUND")
 
 def get_service_status(service_name):
     """Retrieve the current status (Running, Stopped, etc.) of a service."""
@@ -19,13 +35,13 @@ def get_service_status(service_name):
                             capture_output=True, text=True)
     return result.stdout.strip()
 
-def control_service(display_name, action):
+def control_service(display_name, action, ttl=DEFAULT_TTL):
     action = action.lower()
     if action not in ["start", "stop"]:
         print("Invalid action. Use 'start' or 'stop'.")
         return
 
-    service_name = get_service_name_from_display(display_name)
+    service_name = get_service_name_from_display(display_name, ttl)
     if service_name == "NOT_FOUND":
         print(f"[SKIPPED] Could not find service with display name: '{display_name}'")
         return
@@ -55,13 +71,217 @@ def control_service(display_name, action):
         print("    Output:", e.stdout.strip())
         print("    Error :", e.stderr.strip())
 
+def ps_quote(value):
+    """Quote a value as a PowerShell single-quoted string literal."""
+    return "'" + value.replace("'", "''") + "'"
+
+def load_dependency_graph(graph_file):
+    """Read {display name pattern: [patterns it depends on]}. A missing file means no dependencies."""
+    if not graph_file or not os.path.isfile(graph_file):
+        return {}
+    with open(graph_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def resolve_graph(graph, display_names):
+    """Turn a graph of display name patterns into one of the requested display names.
+
+    Keys and dependencies are fnmatch patterns, so a graph such as
+    "Teamcenter FSC Service FSC_*" works on every host. Patterns matching no
+    requested service are reported, since they silently order nothing.
+    """
+    def matches(pattern):
+        return [name for name in display_names if name == pattern or fnmatch.fnmatchcase(name, pattern)]
+
+    unmatched = set()
+    resolved = {}
+    for pattern, dep_patterns in graph.items():
+        names = matches(pattern)
+        if not names:
+            unmatched.add(pattern)
+        deps = []
+        for dep_pattern in dep_patterns:
+            dep_names = matches(dep_pattern)
+            if not dep_names:
+                unmatched.add(dep_pattern)
+            deps.extend(dep_names)
+        for name in names:
+            resolved.setdefault(name, [])
+            resolved[name].extend(dep for dep in deps if dep != name and dep not in resolved[name])
+    for pattern in sorted(unmatched):
+        print(f"[WARNING] Dependency graph entry '{pattern}' matches none of the requested services.")
+    return resolved
+
+def compute_waves(display_names, graph):
+    """Group services into waves so every service comes after all of its dependencies.
+
+    Services within a wave are independent of each other. Dependencies that are not
+    in display_names are treated as already satisfied.
+    """
+    requested = set(display_names)
+    remaining = {name: {dep for dep in graph.get(name, []) if dep in requested} for name in display_names}
+    waves = []
+    while remaining:
+        ready = [name for name, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"Dependency cycle between services: {sorted(remaining)}")
+        waves.append(ready)
+        for name in ready:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return waves
+
+def compute_blockers(display_names, graph, action):
+    """Services whose failure means a service should be left alone.
+
+    A service is only started once its dependencies started, and only stopped once
+    the services that depend on it stopped.
+    """
+    requested = set(display_names)
+    if action == "start":
+        return {name: [dep for dep in graph.get(name, []) if dep in requested] for name in display_names}
+    return {name: [other for other in display_names if name in graph.get(other, [])] for name in display_names}
+
+def build_batch_script(waves, action, service_names, blockers=None, timeout=120):
+    """Build one PowerShell script that applies action wave by wave and prints JSON results.
+
+    Within a wave every Start()/Stop() is issued before waiting on any of them, so
+    independent services change state in parallel. service_names maps display names
+    to internal names so only those services are queried; None enumerates every
+    service on the machine the script runs on (e.g. a remote host).
+    """
+    wave_lines = "\n".join(f"    $waves += ,@({', '.join(ps_quote(name) for name in wave)})" for wave in waves)
+    blocker_lines = "\n".join(
+        f"    $blockers[{ps_quote(name)}] = @({', '.join(ps_quote(dep) for dep in deps)})"
+        for name, deps in (blockers or {}).items() if deps
+    )
+    lookup_line = ""
+    if service_names is None:
+        lookup_line = "foreach ($s in Get-Service) { $byDisplayName[$s.DisplayName] = $s }"
+    elif service_names:
+        names = ", ".join(ps_quote(name) for name in sorted(set(service_names.values())))
+        lookup_line = f"foreach ($s in Get-Service -Name @({names}) -ErrorAction SilentlyContinue) {{ $byDisplayName[$s.DisplayName] = $s }}"
+    return f"""
+    $action = {ps_quote(action)}
+    $target = if ($action -eq 'start') {{ 'Running' }} else {{ 'Stopped' }}
+    $timeout = [TimeSpan]::FromSeconds({timeout})
+    $waves = @()
+{wave_lines}
+    $blockers = @{{}}
+{blocker_lines}
+    $byDisplayName = @{{}}
+    {lookup_line}
+    $failed = @{{}}
+    $results = @()
+    $waveNumber = 0
+    foreach ($wave in $waves) {{
+        $waveNumber++
+        $pending = @()
+        foreach ($displayName in $wave) {{
+            $svc = $byDisplayName[$displayName]
+            if (-not $svc) {{
+                $results += [pscustomobject]@{{ display_name = $displayName; wave = $waveNumber; name = $null; before = $null; action = 'not_found'; after = $null; error = $null }}
+                continue
+            }}
+            $before = $svc.Status.ToString()
+            $failedBlockers = @(foreach ($b in @($blockers[$displayName])) {{ if ($b -and $failed[$b]) {{ $b }} }})
+            if ($failedBlockers.Count -gt 0) {{
+                $failed[$displayName] = $true
+                $results += [pscustomobject]@{{ display_name = $displayName; wave = $waveNumber; name = $svc.Name; before = $before; action = 'blocked'; after = $before; error = ($failedBlockers -join ', ') }}
+                continue
+            }}
+            if ($before -eq $target) {{
+                $results += [pscustomobject]@{{ display_name = $displayName; wave = $waveNumber; name = $svc.Name; before = $before; action = 'none'; after = $before; error = $null }}
+                continue
+            }}
+            try {{
+                if ($action -eq 'start') {{ $svc.Start() }} else {{ $svc.Stop() }}
+                $pending += [pscustomobject]@{{ display_name = $displayName; svc = $svc; before = $before }}
+            }} catch {{
+                $failed[$displayName] = $true
+                $results += [pscustomobject]@{{ display_name = $displayName; wave = $waveNumber; name = $svc.Name; before = $before; action = 'failed'; after = $before; error = $_.Exception.Message }}
+            }}
+        }}
+        foreach ($p in $pending) {{
+            $taken = $action
+            $err = $null
+            try {{
+                $p.svc.WaitForStatus($target, $timeout)
+            }} catch {{
+                $taken = 'failed'
+                $err = "Did not reach status $target within $($timeout.TotalSeconds) seconds"
+                $failed[$p.display_name] = $true
+            }}
+            $p.svc.Refresh()
+            $results += [pscustomobject]@{{ display_name = $p.display_name; wave = $waveNumber; name = $p.svc.Name; before = $p.before; action = $taken; after = $p.svc.Status.ToString(); error = $err }}
+        }}
+    }}
+    ConvertTo-Json -InputObject @($results) -Compress
+    """
+
+def control_services_batch(display_names, action, graph=None, timeout=120, ttl=DEFAULT_TTL):
+    """Start or stop all services in one PowerShell session and return the per-service results.
+
+    Services start in dependency order, one wave of independent services at a time,
+    and stop in the reverse order.
+    """
+    graph = resolve_graph(graph or {}, display_names)
+    try:
+        waves = compute_waves(display_names, graph)
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        return None
+    if action == "stop":
+        waves.reverse()
+    for number, wave in enumerate(waves, 1):
+        print(f"Wave {number}: {', '.join(wave)}")
+
+    service_names = resolve_service_names(display_names, ttl)
+    ps_script = build_batch_script(waves, action, service_names, compute_blockers(display_names, graph, action), timeout)
+    result = subprocess.run(["powershell", "-NoProfile", "-Command", ps_script],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"[ERROR] Batch PowerShell script failed with return code {result.returncode}.")
+        print("    Error :", result.stderr.strip())
+        return None
+    try:
+        results = json.loads(result.stdout)
+    except json.JSONDecodeError:
+        print("[ERROR] Could not parse batch results:", result.stdout.strip())
+        return None
+
+    for entry in results:
+        display_name, service_name = entry["display_name"], entry["name"]
+        print(f"\n--- Processing: {display_name} ---")
+        if entry["action"] == "not_found":
+            print(f"[SKIPPED] Could not find service with display name: '{display_name}'")
+        elif entry["action"] == "none":
+            state = "running" if action == "start" else "stopped"
+            print(f"[NO ACTION] '{display_name}' (internal name: '{service_name}') is already {state}.")
+        elif entry["action"] == "blocked":
+            print(f"[SKIPPED] Did not {action} '{display_name}' (internal name: '{service_name}') because these services failed: {entry['error']}")
+        elif entry["action"] == "failed":
+            print(f"[FAILED] Could not {action} '{display_name}' (internal name: '{service_name}').")
+            print("    Error :", entry["error"])
+        else:
+            print(f"[SUCCESS] {action.capitalize()}ed '{display_name}' (internal name: '{service_name}').")
+            print(f"    Previous status: {entry['before']}")
+            print(f"    Current status : {entry['after']}")
+    return results
+
 def main():
-    if len(sys.argv) != 3:
-        print("Usage: python control_service.py <service_name_or_file> <start|stop>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Start or stop Windows services by display name.")
+    parser.add_argument("service_input", help="Service display name, or a file with one display name per line")
+    parser.add_argument("action", type=str.lower, choices=["start", "stop"], help="Action to perform")
+    parser.add_argument("--no-batch", action="store_true", help="Control services from a file one at a time instead of in one PowerShell session")
+    parser.add_argument("--json", dest="json_file", help="Write the per-service batch results to this JSON file")
+    parser.add_argument("--graph", default=GRAPH_FILE, help="JSON file mapping each service display name to the services it depends on")
+    parser.add_argument("--timeout", type=int, default=120, help="Seconds to wait for each service to reach its new status")
+    parser.add_argument("--ttl", type=int, default=DEFAULT_TTL, help="Reuse the cached service inventory if it is younger than this many seconds")
+    args = parser.parse_args()
 
-    service_input = sys.argv[1]
-    action = sys.argv[2]
+    service_input = args.service_input
+    action = args.action
 
     if os.path.isfile(service_input):
         # The input is a file, read the file and perform actions on each service
@@ -72,14 +292,22 @@ def main():
             print(f"[ERROR] File not found: {service_input}")
             sys.exit(1)
 
-        for display_name in services:
-            print(f"\n--- Processing: {display_name} ---")
-            control_service(display_name, action)
+        if args.no_batch:
+            for display_name in services:
+                print(f"\n--- Processing: {display_name} ---")
+                control_service(display_name, action, args.ttl)
+        else:
+            results = control_services_batch(services, action, load_dependency_graph(args.graph), args.timeout, args.ttl)
+            if results is None:
+                sys.exit(1)
+            if args.json_file:
+                with open(args.json_file, 'w', encoding='utf-8') as f:
+                    json.dump(results, f, indent=2)
 
     else:
         # The input is a single service name, perform the action on that service
         print(f"\n--- Processing: {service_input} ---")
-        control_service(service_input, action)
+        control_service(service_input, action, args.ttl)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,146 @@
+import os
+import sys
+import json
+import logging
+import argparse
+import xml.etree.ElementTree as ET
+from collections import namedtuple, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import unquote
+
+# Below this many files a process pool costs more to start than it saves
+PARALLEL_THRESHOLD = 16
+
+FileIndex = namedtuple("FileIndex", ["xml_file", "datasets", "dangling_refs", "missing_files", "error"])
+PlmxmlIndex = namedtuple("PlmxmlIndex", ["datasets", "dangling_refs", "duplicate_datasets", "missing_files", "errors"])
+
+
+def local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def decode_location(location_ref):
+    # locationRef values are URL-encoded and use Windows separators
+    return unquote(location_ref).replace("\\", os.sep).replace("/", os.sep)
+
+
+def index_plmxml_file(xml_file):
+    """Stream one PLMXML file and resolve its id references and locationRefs."""
+    ids = set()
+    id_refs = []
+    datasets = []
+    external_files = {}
+
+    try:
+        for _, element in ET.iterparse(xml_file, events=("end",)):
+            tag = local_name(element.tag)
+            element_id = element.get("id")
+            if element_id:
+                ids.add(element_id)
+
+            for attr, value in element.attrib.items():
+                if attr == "locationRef":
+                    external_files[element_id] = decode_location(value)
+                elif attr.endswith("Refs") or attr.endswith("Ref"):
+                    id_refs.extend((element_id, attr, ref[1:]) for ref in value.split() if ref.startswith("#"))
+
+            if tag == "DataSet":
+                member_ids = [ref[1:] for ref in element.get("memberRefs", "").split() if ref.startswith("#")]
+                datasets.append((element.get("name"), member_ids))
+
+            if len(element):
+                element.clear()
+    except (ET.ParseError, OSError) as e:
+        return FileIndex(xml_file, {}, [], [], str(e))
+
+    dangling_refs = [(source, attr, target) for source, attr, target in id_refs if target not in ids]
+
+    base_dir = os.path.dirname(xml_file)
+    dataset_files = {}
+    for name, member_ids in datasets:
+        dataset_files[name] = [external_files[m] for m in member_ids if m in external_files]
+    missing_files = sorted(
+        location for location in external_files.values()
+        if not os.path.exists(os.path.join(base_dir, location))
+    )
+
+    return FileIndex(xml_file, dataset_files, dangling_refs, missing_files, None)
+
+
+def build_index(xml_files, workers=None):
+    """Index many PLMXML files, in parallel for large sets, and cross-check dataset names."""
+    if len(xml_files) >= PARALLEL_THRESHOLD and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            file_indexes = list(executor.map(index_plmxml_file, xml_files, chunksize=8))
+    else:
+        file_indexes = [index_plmxml_file(xml_file) for xml_file in xml_files]
+
+    datasets = defaultdict(list)
+    dangling_refs = {}
+    missing_files = {}
+    errors = {}
+
+    for file_index in file_indexes:
+        if file_index.error:
+            errors[file_index.xml_file] = file_index.error
+            continue
+        for name, locations in file_index.datasets.items():
+            datasets[name].append((file_index.xml_file, locations))
+        if file_index.dangling_refs:
+            dangling_refs[file_index.xml_file] = file_index.dangling_refs
+        if file_index.missing_files:
+            missing_files[file_index.xml_file] = file_index.missing_files
+
+    duplicate_datasets = {name: [xml_file for xml_file, _ in entries] for name, entries in datasets.items() if len(entries) > 1}
+    return PlmxmlIndex(dict(datasets), dangling_refs, duplicate_datasets, missing_files, errors)
+
+
+def log_index_report(index):
+    """Log the findings and return True when no blocking problem was found.
+
+    Parse errors and dangling id references block the import; duplicate dataset
+    names and missing external files are reported as warnings.
+    """
+    for xml_file, error in index.errors.items():
+        logging.error(f"Could not parse {xml_file}: {error}")
+    for xml_file, refs in index.dangling_refs.items():
+        for source, attr, target in refs:
+            logging.error(f"Dangling reference in {xml_file}: {source}.{attr} -> #{target}")
+    for name, xml_files in index.duplicate_datasets.items():
+        logging.warning(f"Dataset '{name}' is defined in more than one place: {xml_files}")
+    for xml_file, locations in index.missing_files.items():
+        for location in locations:
+            logging.warning(f"External file referenced by {xml_file} not found: {location}")
+
+    logging.info(f"Indexed {len(index.datasets)} datasets.")
+    return not (index.errors or index.dangling_refs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index PLMXML stylesheet exports and report broken references.")
+    parser.add_argument("source_dir", help="Directory containing PLMXML files (searched recursively)")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: CPU count)")
+    parser.add_argument("--json", dest="json_file", help="Write the dataset -> file index to this JSON file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    xml_files = [
+        os.path.join(root, file)
+        for root, _, files in os.walk(args.source_dir)
+        for file in files
+        if file.endswith(".xml") and file != "build.xml"
+    ]
+    index = build_index(xml_files, args.workers)
+    ok = log_index_report(index)
+
+    if args.json_file:
+        with open(args.json_file, 'w', encoding='utf-8') as f:
+            json.dump(index._asdict(), f, indent=2)
+        logging.info(f"Index written to {args.json_file}")
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import os
+import copy
+import logging
+import xml.etree.ElementTree as ET
+
+PREFERENCES_ENCODING = "ISO-8859-15"
+
+
+class PreferenceFileError(Exception):
+    """Raised when a preference XML file cannot be used for import."""
+
+
+def read_preference_entries(xml_file_path):
+    """Parse and validate a preferences_manager XML file.
+
+    Returns a list of (category_name, category_description, preference_element) tuples.
+    """
+    try:
+        root = ET.parse(xml_file_path).getroot()
+    except ET.ParseError as e:
+        raise PreferenceFileError(f"{xml_file_path}: not well-formed XML ({e})")
+
+    if root.tag != "preferences":
+        raise PreferenceFileError(f"{xml_file_path}: root element is <{root.tag}>, expected <preferences>")
+
+    entries = []
+    for category in root.iter("category"):
+        category_name = category.get("name")
+        if not category_name:
+            raise PreferenceFileError(f"{xml_file_path}: <category> without a name")
+        description = category.findtext("category_description")
+        for preference in category.findall("preference"):
+            preference_name = preference.get("name")
+            if not preference_name:
+                raise PreferenceFileError(f"{xml_file_path}: <preference> without a name in category '{category_name}'")
+            for context in preference.findall("context"):
+                if not context.get("name"):
+                    raise PreferenceFileError(f"{xml_file_path}: <context> without a name in preference '{preference_name}'")
+            entries.append((category_name, description, preference))
+    return entries
+
+
+def _merge_context_values(existing, incoming):
+    """Union the <value> lists of two definitions of the same preference, per context."""
+    merged = copy.deepcopy(incoming)
+    incoming_contexts = {c.get("name"): c for c in merged.findall("context")}
+
+    for old_context in existing.findall("context"):
+        name = old_context.get("name")
+        new_context = incoming_contexts.get(name)
+        if new_context is None:
+            merged.append(copy.deepcopy(old_context))
+            continue
+
+        old_values = [(v.text or "").strip() for v in old_context.findall("value")]
+        new_values = [(v.text or "").strip() for v in new_context.findall("value")]
+        for value in new_context.findall("value"):
+            new_context.remove(value)
+        for text in old_values + [v for v in new_values if v not in old_values]:
+            ET.SubElement(new_context, "value").text = text
+
+    return merged
+
+
+def merge_preference_files(xml_file_paths, action):
+    """Merge preference files into one <preferences> document; later files win.
+
+    With OVERRIDE a later definition replaces the earlier one. With ADD and REMOVE
+    the values of every context are united, since preferences_manager applies them
+    value by value.
+    """
+    merged = {}
+    categories = {}
+
+    for xml_file_path in xml_file_paths:
+        for category_name, description, preference in read_preference_entries(xml_file_path):
+            categories.setdefault(category_name, description)
+            name = preference.get("name")
+            if name in merged and action != "OVERRIDE":
+                preference = _merge_context_values(merged[name][1], preference)
+            elif name in merged:
+                logging.debug(f"Preference '{name}' overridden by {os.path.basename(xml_file_path)}")
+            merged[name] = (category_name, preference)
+
+    root = ET.Element("preferences", version="10.0")
+    category_elements = {}
+    for name, (category_name, preference) in merged.items():
+        if category_name not in category_elements:
+            category = ET.SubElement(root, "category", name=category_name)
+            if categories[category_name] is not None:
+                ET.SubElement(category, "category_description").text = categories[category_name]
+            category_elements[category_name] = category
+        category_elements[category_name].append(copy.deepcopy(preference))
+
+    return root, len(merged)
+
+
+def write_preference_document(root, output_path):
+    for element in root.iter():
+        if len(element):
+            element.text = None
+        element.tail = None
+    ET.indent(root, space="  ")
+    ET.ElementTree(root).write(output_path, encoding=PREFERENCES_ENCODING, xml_declaration=True)
+
+
+def iter_preference_values(xml_file_path):
+    """Stream (preference_name, context_name, values) triples without building the whole tree."""
+    preference_name = None
+    context_name = None
+    values = []
+
+    for event, element in ET.iterparse(xml_file_path, events=("start", "end")):
+        if event == "start":
+            if element.tag == "preference":
+                preference_name = element.get("name")
+            elif element.tag == "context":
+                context_name = element.get("name")
+                values = []
+            continue
+
+        if element.tag == "value":
+            values.append((element.text or "").strip())
+        elif element.tag == "context":
+            yield preference_name, context_name, tuple(values)
+            context_name = None
+        elif element.tag == "preference":
+            preference_name = None
+            element.clear()
+
+
+def load_preference_values(xml_file_path):
+    """Return {(preference_name, context_name): values} for a preference file."""
+    return {(name, context): values for name, context, values in iter_preference_values(xml_file_path)}
+
+
+def changed_preferences(desired, current, action):
+    """Return the names of the desired preferences that would change the current site values."""
+    changed = set()
+    for (name, context), values in desired.items():
+        existing = current.get((name, context))
+        if action == "OVERRIDE":
+            differs = existing != values
+        elif action == "ADD":
+            differs = existing is None or any(v not in existing for v in values)
+        else:
+            differs = existing is not None and any(v in existing for v in values)
+        if differs:
+            changed.add(name)
+    return changed
+
+
+def filter_preference_document(root, preference_names):
+    """Drop every preference not in preference_names, and categories left empty."""
+    for category in root.findall("category"):
+        for preference in category.findall("preference"):
+            if preference.get("name") not in preference_names:
+                category.remove(preference)
+        if category.find("preference") is None:
+            root.remove(category)
+    return root
@@ -1,10 +1,27 @@
-import subprocess
 import os
 import sys
+import time
 import argparse
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
+from tc_env import resolve_tc_environment
+from process_runner import run_streaming, log_tail
+from run_journal import RunJournal
+from tracing import span, run_traced
+from preferences_xml import (
+    PreferenceFileError,
+    changed_preferences,
+    filter_preference_document,
+    load_preference_values,
+    merge_preference_files,
+    write_preference_document,
+)
+
+JOURNAL_FILE = "preferences_journal.jsonl"
+
 # Function to set up logger with timestamped filenames
 def setup_logger():
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -19,15 +36,39 @@ def setup_logger():
     logging.info("Logger initialized.")
     return log_file
 
-def run_preferences_manager(tc_root, preferences_manager_path, user, password_file_name, group, scope, mode, action, folder, log_file, xml_files, bat_file_path):
+def journal_target(tc_root, group, scope, mode, action):
+    # A file already imported into the same site, group, scope and action is a completed unit
+    return f"{tc_root}|{group}|{scope}|{mode}|{action}"
+
+def source_file_paths(folder, xml_files):
+    """The existing, non-empty source files of a batch or delta import, as merge_xml_files reads them."""
+    paths = [os.path.join(folder or "", xml_file.strip()).replace("\\", "/") for xml_file in xml_files]
+    return [path for path in paths if os.path.isfile(path) and os.path.getsize(path) > 0]
+
+def all_sources_done(journal, target, source_paths):
+    # The merged document is one import, so it is skipped only when every source file is done
+    if journal and source_paths and all(journal.is_done(target, path) for path in source_paths):
+        logging.info(f"Skipping import: all {len(source_paths)} source files already imported according to the journal")
+        return True
+    return False
+
+def record_sources(journal, target, source_paths):
+    # The generated document is named after this run's log, so the source files are journaled instead
+    if journal:
+        for path in source_paths:
+            journal.record(target, path)
+
+def run_preferences_manager(tc_root, preferences_manager_path, user, password_file_name, group, scope, mode, action, folder, log_file, xml_files, env, journal=None):
     logging.info("Inside run_preferences_manager with TC_ROOT: %s", tc_root)
 
     # Ensure xml_files is not empty
     if not xml_files:
         logging.error("No XML files provided.")
-        return
+        return False
 
     logging.info(f"Processing XML files: {xml_files}")
+    success = True
+    target = journal_target(tc_root, group, scope, mode, action)
 
     for xml_file in xml_files:
         # Dynamically construct the full XML file path using folder path and file name
@@ -39,6 +80,7 @@ def run_preferences_manager(tc_root, preferences_manager_path, user, password_fi
         # Ensure the XML file path exists
         if not os.path.isfile(xml_file_path):
             logging.error(f"Error: The XML file does not exist at {xml_file_path}")
+            success = False
             continue
 
         # Skip empty files
@@ -54,69 +96,242 @@ def run_preferences_manager(tc_root, preferences_manager_path, user, password_fi
 
         if not os.path.isfile(password_file_path):
             logging.error(f"Error: The password file does not exist at {password_file_path}")
+            success = False
             continue
 
-        # Construct the command to execute the preferences_manager.exe after setting the environment
-        command = f'"{bat_file_path}" && "{preferences_manager_path}" -u={user} -pf="{password_file_path}" -g={group} -scope={scope} -mode={mode} -action={action} -file="{xml_file_path}"'
+        if journal and journal.is_done(target, xml_file_path):
+            logging.info(f"Skipping {xml_file_path}: already imported according to the journal")
+            continue
+
+        # The TC environment is passed through env=, so the batch file is not sourced again here
+        command = f'"{preferences_manager_path}" -u={user} -pf="{password_file_path}" -g={group} -scope={scope} -mode={mode} -action={action} -file="{xml_file_path}"'
 
         logging.info(f"Constructed command: {command}")
 
         try:
-            result = subprocess.run(command, capture_output=True, shell=True, text=True)
+            with span("preference_file", file=xml_file_path, group=group, scope=scope) as s:
+                s.add_files([xml_file_path])
+                result = run_streaming(command, env=env)
+                s.set(exit_code=result.returncode)
             if result.returncode == 0:
                 logging.info(f"✅ Successfully executed for {xml_file_path}")
-                logging.info(f"stdout:\n{result.stdout}")
+                if journal:
+                    journal.record(target, xml_file_path)
             else:
                 logging.error(f"Command failed for {xml_file_path}")
-                logging.error(f"stderr: {result.stderr}")
-                logging.error(f"stdout: {result.stdout}")
+                log_tail(result)
+                success = False
         except FileNotFoundError as e:
             logging.error(f"Exception running command for {xml_file_path}: {e}")
+            success = False
+
+    return success
+
+def merge_xml_files(folder, xml_files, action, merged_file_path):
+    xml_file_paths = []
+    for xml_file in xml_files:
+        xml_file_path = os.path.join(folder or "", xml_file.strip()).replace("\\", "/")
+        if not os.path.isfile(xml_file_path):
+            logging.error(f"Error: The XML file does not exist at {xml_file_path}")
+            continue
+        if os.path.getsize(xml_file_path) == 0:
+            logging.warning(f"Skipping empty file: {xml_file_path}")
+            continue
+        xml_file_paths.append(xml_file_path)
+
+    if not xml_file_paths:
+        logging.error("No XML files to merge.")
+        return None
+
+    try:
+        with span("merge") as s:
+            s.add_files(xml_file_paths)
+            merged_root, preference_count = merge_preference_files(xml_file_paths, action)
+    except PreferenceFileError as e:
+        logging.error(f"Invalid preference file: {e}")
+        return None
+
+    write_preference_document(merged_root, merged_file_path)
+    logging.info(f"Merged {len(xml_file_paths)} files into {preference_count} preferences: {merged_file_path}")
+    return merged_root
+
+def run_batch_import(tc_root, preferences_manager_path, user, password_file_name, group, scope, mode, action, folder, log_file, xml_files, env, journal=None):
+    target = journal_target(tc_root, group, scope, mode, action)
+    source_paths = source_file_paths(folder, xml_files)
+    if all_sources_done(journal, target, source_paths):
+        return True
+
+    # Merge every XML file into one validated document so preferences_manager logs in only once
+    merged_file_path = os.path.abspath(os.path.splitext(log_file)[0] + "_batch.xml")
+    if merge_xml_files(folder, xml_files, action, merged_file_path) is None:
+        logging.error("Batch import aborted.")
+        return False
+
+    if not run_preferences_manager(tc_root, preferences_manager_path, user, password_file_name, group, scope, mode, action,
+                                   os.path.dirname(merged_file_path), log_file, [os.path.basename(merged_file_path)], env):
+        return False
+    record_sources(journal, target, source_paths)
+    return True
+
+def export_preferences(tc_root, user, password_file_name, group, scope, out_file, env):
+    preferences_manager_path = os.path.join(tc_root, "bin", "preferences_manager.exe").replace("\\", "/")
+    password_file_path = os.path.join(tc_root, "security", password_file_name).replace("\\", "/")
+    command = f'"{preferences_manager_path}" -u={user} -pf="{password_file_path}" -g={group} -scope={scope} -mode=export -out_file="{out_file}"'
+
+    logging.info(f"Exporting current {scope} preferences: {command}")
+    with span("export", group=group, scope=scope) as s:
+        result = run_streaming(command, env=env)
+        s.set(exit_code=result.returncode)
+    if result.returncode != 0 or not os.path.isfile(out_file):
+        logging.error(f"Export of current preferences failed with return code {result.returncode}")
+        log_tail(result)
+        return False
+    return True
 
-def set_environment_variable_from_bat(bat_file_path, preferences_manager_path, user, password_file_name, group, scope, mode, action, folder, log_file, xml_files):
-    logging.info(f"Running batch file: {bat_file_path}")
+def run_delta_import(tc_root, preferences_manager_path, user, password_file_name, group, scope, mode, action, folder, log_file, xml_files, env, journal=None):
+    target = journal_target(tc_root, group, scope, mode, action)
+    source_paths = source_file_paths(folder, xml_files)
+    if all_sources_done(journal, target, source_paths):
+        return True
 
-    result = subprocess.run([bat_file_path], capture_output=True, shell=True, text=True)
+    # Import only the preferences whose values differ from what the site currently holds
+    base_path = os.path.abspath(os.path.splitext(log_file)[0])
+    desired_file_path = base_path + "_desired.xml"
+    current_file_path = base_path + "_current.xml"
+    delta_file_path = base_path + "_delta.xml"
 
-    if result.returncode != 0:
-        logging.error(f"Failed to execute batch file: {bat_file_path}")
-        logging.error(result.stderr)
-        return
+    merged_root = merge_xml_files(folder, xml_files, action, desired_file_path)
+    if merged_root is None:
+        logging.error("Delta import aborted.")
+        return False
 
-    tc_root = None
-    tc_data = None
+    if not export_preferences(tc_root, user, password_file_name, group, scope, current_file_path, env):
+        logging.error("Delta import aborted.")
+        return False
 
-    for line in result.stdout.splitlines():
-        if "TC_ROOT=" in line:
-            tc_root = line.split('=')[1].strip()
-        elif "TC_DATA=" in line:
-            tc_data = line.split('=')[1].strip()
+    desired = load_preference_values(desired_file_path)
+    current = load_preference_values(current_file_path)
+    changed = changed_preferences(desired, current, action)
 
-    if not tc_root or not tc_data:
-        logging.error("Could not capture TC_ROOT or TC_DATA from batch output.")
-        return
+    if not changed:
+        logging.info("No preference differs from the current site values, skipping import.")
+        record_sources(journal, target, source_paths)
+        return True
 
-    os.environ['TC_ROOT'] = tc_root
-    os.environ['TC_DATA'] = tc_data
-    logging.info(f"Set TC_ROOT={tc_root}")
-    logging.info(f"Set TC_DATA={tc_data}")
+    logging.info(f"{len(changed)} preference(s) changed: {sorted(changed)}")
+    write_preference_document(filter_preference_document(merged_root, changed), delta_file_path)
+
+    if not run_preferences_manager(tc_root, preferences_manager_path, user, password_file_name, group, scope, mode, action,
+                                   os.path.dirname(delta_file_path), log_file, [os.path.basename(delta_file_path)], env):
+        return False
+    record_sources(journal, target, source_paths)
+    return True
+
+def process_xml_files(tc_root, preferences_manager_path, user, password_file_name, group, scope, mode, action, folder, log_file, xml_files, env, batch=False, delta=False, journal=None):
+    if delta and mode == "import":
+        logging.info(f"Delta importing XML files: {xml_files}")
+        return run_delta_import(tc_root, preferences_manager_path, user, password_file_name, group, scope, mode, action, folder, log_file, xml_files, env, journal)
+
+    if batch and mode == "import":
+        logging.info(f"Batch importing XML files: {xml_files}")
+        return run_batch_import(tc_root, preferences_manager_path, user, password_file_name, group, scope, mode, action, folder, log_file, xml_files, env, journal)
+
+    if batch or delta:
+        logging.warning("--batch/--delta only apply to import mode, processing files one by one.")
+    logging.info(f"Found XML files: {xml_files}")
+    success = True
+    for xml_file in xml_files:
+        xml_file_path = os.path.join(folder, xml_file.strip()).replace("\\", "/")
+        logging.info(f"Processing XML file: {xml_file_path}")
+        if not run_preferences_manager(tc_root, preferences_manager_path, user, password_file_name, group, scope, mode, action, folder, log_file, [xml_file], env, journal):
+            success = False
+    return success
+
+class ThreadLogFilter(logging.Filter):
+    """Pass only the records emitted by one thread, so each parallel job gets its own log."""
+
+    def __init__(self, thread_id):
+        super().__init__()
+        self.thread_id = thread_id
+
+    def filter(self, record):
+        # Subprocess output is logged from reader threads tagged with the job's thread
+        return getattr(record, "owner_thread", record.thread) == self.thread_id
+
+def parse_targets(targets, default_scope):
+    # Each target is GROUP or GROUP:SCOPE, e.g. dba:SITE Engineering:GROUP
+    parsed = []
+    for target in targets:
+        group, _, scope = target.partition(":")
+        parsed.append((group, scope or default_scope))
+    return parsed
+
+def run_target_job(tc_root, preferences_manager_path, user, password_file_name, group, scope, mode, action, folder, log_file, xml_files, env, batch, delta, journal=None):
+    job_log_file = f"{os.path.splitext(log_file)[0]}_{group}_{scope}.log"
+    handler = logging.FileHandler(job_log_file, mode="w", encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    handler.addFilter(ThreadLogFilter(threading.get_ident()))
+    logging.getLogger().addHandler(handler)
+
+    start = time.monotonic()
+    try:
+        logging.info(f"Starting job for group={group} scope={scope}")
+        success = process_xml_files(tc_root, preferences_manager_path, user, password_file_name, group, scope, mode, action,
+                                    folder, job_log_file, xml_files, env, batch, delta, journal)
+    except Exception as e:
+        logging.error(f"Job for group={group} scope={scope} failed: {e}")
+        success = False
+    finally:
+        logging.getLogger().removeHandler(handler)
+        handler.close()
+
+    return success, time.monotonic() - start, job_log_file
+
+def run_targets_in_parallel(tc_root, preferences_manager_path, user, password_file_name, targets, mode, action, folder, log_file, xml_files, env, batch, delta, max_workers, journal=None):
+    logging.info(f"Running {len(targets)} target(s) with up to {max_workers} parallel job(s)")
+    results = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefs") as executor:
+        futures = {
+            executor.submit(run_target_job, tc_root, preferences_manager_path, user, password_file_name, group, scope, mode, action,
+                            folder, log_file, xml_files, env, batch, delta, journal): (group, scope)
+            for group, scope in targets
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+
+    lines = [f"{'Group':<25}{'Scope':<10}{'Status':<10}{'Duration':>10}  Log"]
+    for group, scope in targets:
+        success, duration, job_log_file = results[(group, scope)]
+        lines.append(f"{group:<25}{scope:<10}{'SUCCESS' if success else 'FAILED':<10}{duration:>9.1f}s  {job_log_file}")
+    summary = "\n".join(lines)
+    logging.info(f"Per-target results:\n{summary}")
+    print(summary)
+
+    return all(success for success, _, _ in results.values())
+
+def set_environment_variable_from_bat(bat_file_path, preferences_manager_path, user, password_file_name, group, scope, mode, action, folder, log_file, xml_files, batch=False, delta=False, targets=None, max_workers=4, journal=None):
+    tc_env = resolve_tc_environment(bat_file_path)
+    tc_root = tc_env.tc_root
 
     try:
         # If --folder is provided, get XML files inside the folder
         if folder and not xml_files:
             logging.info(f"Getting all XML files from the folder: {folder}")
-            xml_files = [f for f in os.listdir(folder) if f.endswith(".xml")]
-
-        if xml_files:
-            logging.info(f"Found XML files: {xml_files}")
-            for xml_file in xml_files:
-                xml_file_path = os.path.join(folder, xml_file.strip()).replace("\\", "/")
-                logging.info(f"Processing XML file: {xml_file_path}")
-                run_preferences_manager(tc_root, preferences_manager_path, user, password_file_name, group, scope, mode, action, folder, log_file, [xml_file], bat_file_path)
-        else:
+            xml_files = sorted(f for f in os.listdir(folder) if f.endswith(".xml"))
+
+        if not xml_files:
             logging.error("No XML files to process.")
+            return False
+
+        if targets:
+            return run_targets_in_parallel(tc_root, preferences_manager_path, user, password_file_name, parse_targets(targets, scope), mode, action,
+                                           folder, log_file, xml_files, tc_env.env, batch, delta, max_workers, journal)
+
+        return process_xml_files(tc_root, preferences_manager_path, user, password_file_name, group, scope, mode, action, folder, log_file, xml_files, tc_env.env, batch, delta, journal)
     except Exception as e:
         logging.error(f"Error during XML processing: {e}")
+        return False
 
 def main():
     parser = argparse.ArgumentParser(description="Run preferences_manager.exe with dynamic parameters.")
@@ -129,6 +344,12 @@ def main():
     parser.add_argument("--folder", required=False, help="Folder containing XML files. Provide either this or --xml-files, not both.")
     parser.add_argument("-pf", "--password-file", required=True, help="Password file name inside TC security folder.")
     parser.add_argument("--xml-files", nargs='*', help="List of XML files to process. Provide either this or --folder, not both.")
+    parser.add_argument("--batch", action="store_true", help="Merge all XML files (later files win) and import them with a single preferences_manager call.")
+    parser.add_argument("--targets", nargs='+', help="Run for several GROUP or GROUP:SCOPE targets in parallel, e.g. dba:SITE Engineering:GROUP (overrides -g/-scope).")
+    parser.add_argument("--max-workers", type=int, default=4, help="Maximum number of targets processed in parallel (default 4).")
+    parser.add_argument("--delta", action="store_true", help="Export the current scope, diff it against the merged XML files and import only the preferences that changed.")
+    parser.add_argument("--resume", action="store_true", help="Skip XML files the journal records as already imported into the same target.")
+    parser.add_argument("--journal", default=JOURNAL_FILE, help=f"Journal of completed imports (default {JOURNAL_FILE} in the current folder).")
 
     args = parser.parse_args()
     log_file = setup_logger()
@@ -139,7 +360,7 @@ def main():
         xml_files = args.xml_files
     elif args.folder:
         logging.info(f"Processing all XML files from the folder: {args.folder}")
-        xml_files = [f for f in os.listdir(args.folder) if f.endswith(".xml")]
+        xml_files = sorted(f for f in os.listdir(args.folder) if f.endswith(".xml"))
     elif args.xml_files:
         logging.info(f"Processing specified XML files: {args.xml_files}")
         xml_files = args.xml_files
@@ -156,7 +377,10 @@ def main():
         logging.error(f"Batch file path '{bat_file_path}' does not exist.")
         sys.exit(1)
 
-    set_environment_variable_from_bat(
+    # Only imports change Teamcenter, so only they are journaled
+    journal = RunJournal(args.journal, resume=args.resume) if args.mode == 'import' else None
+
+    success = set_environment_variable_from_bat(
         bat_file_path,
         args.preferences_manager,
         args.user,
@@ -167,8 +391,15 @@ def main():
         args.action,
         args.folder,
         log_file,
-        xml_files
+        xml_files,
+        args.batch,
+        args.delta,
+        args.targets,
+        args.max_workers,
+        journal
     )
+    if not success:
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main()
+    run_traced("prefrencesDeploymentScript", main)
@@ -0,0 +1,63 @@
+import logging
+import threading
+import subprocess
+from collections import deque, namedtuple
+
+DEFAULT_TAIL_LINES = 200
+
+ProcessResult = namedtuple("ProcessResult", ["returncode", "tail"])
+
+
+def _pump(stream, stream_name, level, tail, lock, on_line, owner_thread, label):
+    callback_failed = False
+    for line in stream:
+        line = line.rstrip("\r\n")
+        # Records come from a reader thread; owner_thread ties them back to the caller
+        logging.log(level, f"[{label}] {line}" if label else line, extra={"owner_thread": owner_thread})
+        with lock:
+            tail.append(f"[{stream_name}] {line}" if stream_name == "stderr" else line)
+        if on_line:
+            # A failing callback must not stop this thread draining the pipe, or the child blocks on it
+            try:
+                on_line(stream_name, line)
+            except Exception as e:
+                if not callback_failed:
+                    logging.warning(f"on_line callback failed, output is still read: {e}", extra={"owner_thread": owner_thread})
+                callback_failed = True
+    stream.close()
+
+
+def run_streaming(command, env=None, cwd=None, shell=True, tail_lines=DEFAULT_TAIL_LINES, on_line=None, label=None):
+    """Run a command and log stdout/stderr line by line while it runs.
+
+    Only the last `tail_lines` lines are kept in memory (for error reports), so
+    memory stays flat however much the process prints. on_line, if given, is
+    called as on_line(stream_name, line) for every line. label prefixes the logged
+    lines, to tell apart processes running at the same time.
+    """
+    process = subprocess.Popen(
+        command, shell=shell, cwd=cwd, env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        text=True, errors="replace", bufsize=1,
+    )
+
+    tail = deque(maxlen=tail_lines)
+    lock = threading.Lock()
+    owner_thread = threading.get_ident()
+    readers = [
+        threading.Thread(target=_pump, args=(process.stdout, "stdout", logging.INFO, tail, lock, on_line, owner_thread, label), daemon=True),
+        threading.Thread(target=_pump, args=(process.stderr, "stderr", logging.WARNING, tail, lock, on_line, owner_thread, label), daemon=True),
+    ]
+    for reader in readers:
+        reader.start()
+
+    returncode = process.wait()
+    for reader in readers:
+        reader.join()
+
+    return ProcessResult(returncode, list(tail))
+
+
+def log_tail(result, level=logging.ERROR):
+    """Log the buffered tail of a finished process, typically after a failure."""
+    logging.log(level, f"Last {len(result.tail)} lines of output:\n" + "\n".join(result.tail))
@@ -0,0 +1,56 @@
+import os
+import json
+import logging
+import threading
+from datetime import datetime
+
+from hash_utils import sha256_file, sha256_text
+
+
+class RunJournal:
+    """Append-only record of the units of work that completed successfully.
+
+    A unit is one input file applied to one target; its key combines the target
+    with the file's name and content hash, so an edited file or a different target
+    is new work. Each record is one JSON line written with a single write and fsync'd, so
+    a crash can at worst leave a torn last line, which is ignored on load.
+    Without resume nothing is skipped, but completed units are still appended so a
+    later run can resume from this one.
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.resume = resume
+        self.completed = set()
+        if resume and os.path.isfile(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self.completed.add(json.loads(line)["unit"])
+                    except (ValueError, KeyError):
+                        logging.warning(f"Ignoring damaged journal line in {path}")
+            logging.info(f"Resuming: {len(self.completed)} completed unit(s) in {path}")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    @staticmethod
+    def unit_key(target, file_path):
+        return sha256_text(f"{target}\n{os.path.basename(file_path)}\n{sha256_file(file_path)}")
+
+    def is_done(self, target, file_path):
+        return self.resume and self.unit_key(target, file_path) in self.completed
+
+    def record(self, target, file_path):
+        unit = self.unit_key(target, file_path)
+        line = json.dumps({
+            "unit": unit,
+            "target": target,
+            "file": os.path.abspath(file_path),
+            "completed": datetime.now().isoformat(),
+        }) + "\n"
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self.completed.add(unit)
@@ -0,0 +1,178 @@
+import os
+import sys
+import json
+import zlib
+import fnmatch
+import logging
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from hash_utils import CHUNK_SIZE, walk_tree, hash_files
+
+# Formats that are already compressed; deflating them again costs CPU for no gain
+COMPRESSED_EXTENSIONS = {
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".jar", ".war", ".ear",
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".ico",
+    ".woff", ".woff2", ".mp4", ".pdf",
+}
+
+DEFAULT_WORKERS = min(8, (os.cpu_count() or 1) + 2)
+
+
+def is_excluded(rel_path, exclude_patterns):
+    """A pattern excludes a path if it matches the whole relative path or any one path component."""
+    parts = rel_path.split("/")
+    return any(
+        fnmatch.fnmatch(rel_path, pattern) or any(fnmatch.fnmatch(part, pattern) for part in parts)
+        for pattern in exclude_patterns
+    )
+
+
+def blob_path(store_dir, sha256, compressed):
+    return os.path.join(store_dir, "blobs", sha256[:2], sha256 + (".z" if compressed else ".raw"))
+
+
+def write_blob(source_path, target_path, compress):
+    """Write one blob atomically, streaming through zlib when compress is set."""
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    tmp_path = f"{target_path}.{os.getpid()}.tmp"
+    compressor = zlib.compressobj(6) if compress else None
+    with open(source_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+            dst.write(compressor.compress(chunk) if compressor else chunk)
+        if compressor:
+            dst.write(compressor.flush())
+    os.replace(tmp_path, target_path)
+    return os.path.getsize(target_path)
+
+
+def list_snapshots(store_dir):
+    snapshot_dir = os.path.join(store_dir, "snapshots")
+    if not os.path.isdir(snapshot_dir):
+        return []
+    return sorted(os.path.join(snapshot_dir, f) for f in os.listdir(snapshot_dir) if f.endswith(".json"))
+
+
+def load_snapshot(snapshot_path):
+    with open(snapshot_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def create_snapshot(source_dir, store_dir, exclude_patterns=(), workers=DEFAULT_WORKERS, name="snapshot"):
+    """Record source_dir as a manifest, storing each unique file content once."""
+    files, _ = walk_tree(source_dir, lambda rel_path: is_excluded(rel_path, exclude_patterns))
+
+    # Reuse hashes from the previous snapshot for files whose size and mtime are unchanged
+    snapshots = list_snapshots(store_dir)
+    previous = load_snapshot(snapshots[-1])["files"] if snapshots else {}
+    entries, hashed = hash_files(source_dir, files, previous, workers)
+    for rel_path, entry in entries.items():
+        entry["compressed"] = os.path.splitext(rel_path)[1].lower() not in COMPRESSED_EXTENSIONS
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        new_blobs = {}
+        for rel_path, entry in entries.items():
+            target = blob_path(store_dir, entry["sha256"], entry["compressed"])
+            # Keyed by blob path: the same content is stored once per compressed/raw variant
+            if target not in new_blobs and not os.path.exists(target):
+                new_blobs[target] = (os.path.join(source_dir, rel_path), target, entry["compressed"])
+
+        stored_bytes = sum(executor.map(lambda blob: write_blob(*blob), new_blobs.values()))
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    snapshot_path = os.path.join(store_dir, "snapshots", f"{name}_{timestamp}.json")
+    os.makedirs(os.path.dirname(snapshot_path), exist_ok=True)
+    tmp_path = snapshot_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"source": os.path.abspath(source_dir), "created": timestamp, "files": entries}, f)
+    os.replace(tmp_path, snapshot_path)
+
+    stats = {
+        "files": len(entries),
+        "hashed": hashed,
+        "new_blobs": len(new_blobs),
+        "stored_bytes": stored_bytes,
+        "total_bytes": sum(e["size"] for e in entries.values()),
+    }
+    logging.info(
+        f"Snapshot {snapshot_path}: {stats['files']} files ({stats['total_bytes']} bytes), "
+        f"{stats['hashed']} hashed, {stats['new_blobs']} new blobs ({stats['stored_bytes']} bytes stored)"
+    )
+    return snapshot_path, stats
+
+
+def apply_retention(store_dir, keep):
+    """Keep the newest `keep` snapshots and delete blobs no remaining snapshot references."""
+    snapshots = list_snapshots(store_dir)
+    expired = snapshots[:-keep] if keep > 0 else []
+    for snapshot_path in expired:
+        os.unlink(snapshot_path)
+        logging.info(f"Removed expired snapshot: {snapshot_path}")
+
+    referenced = set()
+    for snapshot_path in snapshots[len(expired):]:
+        for entry in load_snapshot(snapshot_path)["files"].values():
+            referenced.add(blob_path(store_dir, entry["sha256"], entry["compressed"]))
+
+    removed = 0
+    blob_root = os.path.join(store_dir, "blobs")
+    for root, _, filenames in os.walk(blob_root):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            # .tmp files are blobs another backup is still writing
+            if path not in referenced and not filename.endswith(".tmp"):
+                os.unlink(path)
+                removed += 1
+    if removed:
+        logging.info(f"Garbage collected {removed} unreferenced blobs.")
+    return len(expired), removed
+
+
+def restore_snapshot(snapshot_path, store_dir, target_dir):
+    """Recreate the files of a snapshot under target_dir."""
+    snapshot = load_snapshot(snapshot_path)
+    for rel_path, entry in snapshot["files"].items():
+        target = os.path.join(target_dir, *rel_path.split("/"))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        decompressor = zlib.decompressobj() if entry["compressed"] else None
+        with open(blob_path(store_dir, entry["sha256"], entry["compressed"]), 'rb') as src, open(target, 'wb') as dst:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                dst.write(decompressor.decompress(chunk) if decompressor else chunk)
+            if decompressor:
+                dst.write(decompressor.flush())
+        os.utime(target, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+    logging.info(f"Restored {len(snapshot['files'])} files from {snapshot_path} to {target_dir}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Content-addressed snapshot store.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    create = sub.add_parser("create", help="Snapshot a directory")
+    create.add_argument("source_dir")
+    create.add_argument("store_dir")
+    create.add_argument("--exclude", nargs="*", default=[], help="fnmatch patterns to exclude")
+    create.add_argument("--keep", type=int, default=0, help="Number of snapshots to retain (0 keeps all)")
+
+    restore = sub.add_parser("restore", help="Restore a snapshot manifest into a directory")
+    restore.add_argument("snapshot")
+    restore.add_argument("store_dir")
+    restore.add_argument("target_dir")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    if args.command == "create":
+        if not os.path.isdir(args.source_dir):
+            logging.error(f"Source directory not found: {args.source_dir}")
+            sys.exit(1)
+        create_snapshot(args.source_dir, args.store_dir, args.exclude)
+        if args.keep:
+            apply_retention(args.store_dir, args.keep)
+    else:
+        restore_snapshot(args.snapshot, args.store_dir, args.target_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import os
+import shutil
+import logging
+from pathlib import Path
+
+
+def is_staged_current(source_path, staged_path):
+    """A staged file is current if it is the same inode, or has the same size and mtime."""
+    try:
+        if os.path.samefile(source_path, staged_path):
+            return True
+        source_stat = os.stat(source_path)
+        staged_stat = os.stat(staged_path)
+    except OSError:
+        return False
+    return source_stat.st_size == staged_stat.st_size and source_stat.st_mtime_ns == staged_stat.st_mtime_ns
+
+
+def link_or_copy(source_path, staged_path):
+    """Hardlink the file when source and staging share a volume, otherwise copy it."""
+    if os.path.lexists(staged_path):
+        os.unlink(staged_path)
+    try:
+        os.link(source_path, staged_path)
+        return "linked"
+    except OSError:
+        # Different volume, or a filesystem without hardlink support
+        shutil.copy2(source_path, staged_path)
+        return "copied"
+
+
+def stage_files(file_paths, staging_dir):
+    """Make staging_dir hold exactly the given files (by file name) and return per-action counts."""
+    os.makedirs(staging_dir, exist_ok=True)
+    stats = {"linked": 0, "copied": 0, "reused": 0, "removed": 0}
+
+    wanted = {}
+    for file_path in file_paths:
+        name = Path(file_path).name
+        if name in wanted:
+            logging.warning(f"Duplicate file name {name}: {file_path} replaces {wanted[name]} in staging")
+        wanted[name] = file_path
+
+    for entry in os.scandir(staging_dir):
+        if entry.name not in wanted:
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path)
+            else:
+                os.unlink(entry.path)
+            stats["removed"] += 1
+
+    for name, source_path in wanted.items():
+        staged_path = os.path.join(staging_dir, name)
+        if is_staged_current(source_path, staged_path):
+            stats["reused"] += 1
+        else:
+            stats[link_or_copy(source_path, staged_path)] += 1
+
+    logging.info(
+        f"Staged {len(wanted)} files in {staging_dir}: {stats['linked']} linked, {stats['copied']} copied, "
+        f"{stats['reused']} reused, {stats['removed']} stale removed"
+    )
+    return stats
@@ -1,12 +1,22 @@
 import os
 import sys
-import subprocess
 import argparse
 import logging
+import json
 import shutil
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 
+from tc_env import resolve_tc_environment
+from process_runner import run_streaming, log_tail
+from hash_utils import sha256_file, sha256_text
+from staging import stage_files
+from run_journal import RunJournal
+from tracing import span, current_span, run_traced
+from plmxml_index import build_index, log_index_report
+
 
 def setup_logger():
     timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
@@ -25,37 +35,6 @@ def setup_logger():
     return log_file
 
 
-def run_tc_bat_file_and_capture_env(bat_file_path):
-    logging.info(f"Running batch file to set TC_ROOT and TC_DATA: {bat_file_path}")
-    # Run the batch file and then 'set' to capture environment variables it sets
-    process = subprocess.run(f'cmd /c "{bat_file_path} && set"', capture_output=True, shell=True, text=True)
-
-    if process.returncode != 0:
-        logging.error("Failed to execute batch file.")
-        logging.error(process.stderr)
-        sys.exit(1)
-
-    tc_root = None
-    tc_data = None
-
-    for line in process.stdout.splitlines():
-        if line.startswith("TC_ROOT="):
-            tc_root = line.split("=", 1)[1].strip()
-        elif line.startswith("TC_DATA="):
-            tc_data = line.split("=", 1)[1].strip()
-
-    if not tc_root or not tc_data:
-        logging.error("Could not extract TC_ROOT or TC_DATA from batch file output.")
-        sys.exit(1)
-
-    os.environ['TC_ROOT'] = tc_root
-    os.environ['TC_DATA'] = tc_data
-    logging.info(f"Set TC_ROOT={tc_root}")
-    logging.info(f"Set TC_DATA={tc_data}")
-
-    return tc_root
-
-
 def validate_environment(install_user, install_group, tc_root):
     if not install_user or not install_group or not tc_root:
         logging.error("Missing required configuration: INSTALL_USER, INSTALL_GROUP, or TC_ROOT")
@@ -88,9 +67,59 @@ def collect_xml_files(source_dir):
     return xml_files
 
 
+def canonical_xml_hash(file_path):
+    # Hash the C14N form so whitespace-only edits do not count as changes
+    try:
+        return sha256_text(ET.canonicalize(from_file=file_path, strip_text=True))
+    except ET.ParseError as e:
+        logging.warning(f"Could not canonicalize {file_path} ({e}), hashing raw content instead.")
+        return sha256_file(file_path)
+
+
+def load_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable manifest {manifest_path}: {e}")
+        return {}
+
+
+def manifest_file(work_dir, target):
+    """Manifest of one site and group; an import into DEV says nothing about PROD."""
+    return os.path.join(work_dir, f"stylesheet_manifest_{sha256_text(target)[:16]}.json")
+
+
+def save_manifest(manifest_path, manifest):
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+    logging.info(f"Manifest updated: {manifest_path}")
+
+
+def select_changed_files(xml_files, manifest):
+    """Return the files whose canonical hash differs from the manifest, with all current hashes."""
+    hashes = {file_path: canonical_xml_hash(file_path) for file_path in xml_files}
+    changed = [
+        file_path for file_path in xml_files
+        if manifest.get(Path(file_path).stem, {}).get("sha256") != hashes[file_path]
+    ]
+    return changed, hashes
+
+
+def update_manifest(manifest, imported_files, hashes):
+    for file_path in imported_files:
+        manifest[Path(file_path).stem] = {"sha256": hashes[file_path], "source": os.path.abspath(file_path)}
+    return manifest
+
+
 def prepare_input_file(xml_files, staging_dir, input_file_path, backup_old=True):
     try:
-        os.makedirs(staging_dir, exist_ok=True)
+        stage_files(xml_files, staging_dir)
 
         if backup_old and os.path.exists(input_file_path):
             shutil.move(input_file_path, input_file_path + ".bak")
@@ -100,8 +129,6 @@ def prepare_input_file(xml_files, staging_dir, input_file_path, backup_old=True)
             for file_path in xml_files:
                 filename = Path(file_path).name
                 dataset_name = Path(file_path).stem
-                staged_path = os.path.join(staging_dir, filename)
-                shutil.copy(file_path, staged_path)
                 input_file.write(f"{dataset_name}, {filename}\n")
 
         logging.info(f"Input file prepared at: {input_file_path}")
@@ -111,27 +138,75 @@ def prepare_input_file(xml_files, staging_dir, input_file_path, backup_old=True)
         return False
 
 
-def import_stylesheets(exe_path, install_user, install_pwf, install_group, input_file, staging_dir, tc_bat_path):
-    # Construct command string to run batch file first, then exe with arguments
-    command = f'cmd /c "{tc_bat_path} && "{exe_path}" -u={install_user} -pf={install_pwf} -g={install_group} -input={input_file} -filepath={staging_dir} -replace"'
+def split_chunks(files, chunk_size):
+    """Split files into consecutive chunks of chunk_size; 0 keeps them in one chunk."""
+    if chunk_size <= 0:
+        return [files]
+    return [files[i:i + chunk_size] for i in range(0, len(files), chunk_size)]
+
+
+def drop_duplicate_datasets(files):
+    """Keep one file per dataset name, the last one, as staging would.
+
+    Shards and chunks run concurrently, so two files of the same dataset in different
+    ones would -replace it in whatever order the imports happen to finish.
+    """
+    by_dataset = {}
+    for file_path in files:
+        dataset_name = Path(file_path).stem
+        if dataset_name in by_dataset:
+            logging.warning(f"Duplicate dataset {dataset_name}: importing {file_path}, not {by_dataset[dataset_name]}")
+            del by_dataset[dataset_name]
+        by_dataset[dataset_name] = file_path
+    return list(by_dataset.values())
+
+
+def split_shards(files, shards):
+    """Deal files round-robin into at most `shards` lists of nearly equal size."""
+    return [files[i::shards] for i in range(min(shards, len(files)))]
+
+
+def shard_paths(work_dir, index):
+    """Staging folder and input file of one shard; shards never share either."""
+    shard_dir = os.path.join(work_dir, "shards", f"shard_{index:03d}")
+    return os.path.join(shard_dir, "xml_files"), os.path.join(shard_dir, "input.txt")
+
+
+def import_units(units, run_unit, max_parallel, retries):
+    """Run run_unit(index, attempt) for every unit, max_parallel at a time.
+
+    Units that fail are run again, up to `retries` more times; units that succeeded
+    are not repeated. Returns the indexes of the units that still failed.
+    """
+    pending = list(range(len(units)))
+    for attempt in range(retries + 1):
+        if attempt:
+            logging.warning(f"Retrying {len(pending)} failed shard(s), attempt {attempt + 1} of {retries + 1}")
+        with ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="shard") as executor:
+            results = list(executor.map(lambda index: run_unit(index, attempt), pending))
+        pending = [index for index, ok in zip(pending, results) if not ok]
+        if not pending:
+            break
+    return pending
+
+
+def import_stylesheets(exe_path, install_user, install_pwf, install_group, input_file, staging_dir, env, label=None):
+    # The TC environment is passed through env=, so the batch file does not need to be sourced again
+    command = f'"{exe_path}" -u={install_user} -pf={install_pwf} -g={install_group} -input={input_file} -filepath={staging_dir} -replace'
 
     logging.info(f"Prepared command: {command}")
 
     try:
-        result = subprocess.run(command, capture_output=True, text=True, shell=True)
+        result = run_streaming(command, env=env, label=label)
+        current_span().set(exit_code=result.returncode)
         if result.returncode == 0:
-            logging.info(f"Command STDOUT:\n{result.stdout}")
-            if result.stderr:
-                logging.warning(f"Command STDERR:\n{result.stderr}")
             logging.info("Stylesheet import completed successfully.")
-        else:
-            logging.error(f"Import failed with return code {result.returncode}")
-            logging.error(f"STDOUT:\n{result.stdout}")
-            logging.error(f"STDERR:\n{result.stderr}")
-            sys.exit(1)
+            return True
+        logging.error(f"Import failed with return code {result.returncode}")
+        log_tail(result)
     except Exception as e:
         logging.error(f"Failed to run the import command: {e}")
-        sys.exit(1)
+    return False
 
 
 def main():
@@ -141,11 +216,19 @@ def main():
     parser.add_argument("-install-user", type=str, required=True, help="Install user")
     parser.add_argument("-install-group", type=str, required=True, help="Install group")
     parser.add_argument("-tc-bat", type=str, required=True, help="Path to batch file to set TC environment")
+    parser.add_argument("-skip-validation", action="store_true", help="Skip the PLMXML reference pre-validation")
+    parser.add_argument("-full", action="store_true", help="Import every stylesheet, ignoring the manifest of previously imported hashes")
+    parser.add_argument("-resume", action="store_true", help="Skip stylesheets the journal records as already imported by an earlier, interrupted run")
+    parser.add_argument("-chunk-size", type=int, default=0, help="Import this many stylesheets per importer call, journaling each chunk (default 0: one call)")
+    parser.add_argument("-shards", type=int, default=1, help="Split the stylesheets into this many input files, each with its own staging folder (overrides -chunk-size)")
+    parser.add_argument("-max-parallel", type=int, default=1, help="Number of importer calls running at once (default 1)")
+    parser.add_argument("-retries", type=int, default=1, help="How many times a failed shard or chunk is imported again (default 1)")
     args = parser.parse_args()
     setup_logger()
 
     logging.info("Starting XML Stylesheet Import Process...")
-    tc_root = run_tc_bat_file_and_capture_env(args.tc_bat)
+    tc_env = resolve_tc_environment(args.tc_bat)
+    tc_root = tc_env.tc_root
 
     install_user = args.install_user
     install_group = args.install_group
@@ -156,6 +239,7 @@ def main():
     WORK_DIR = os.path.join(TEMP_DIR, 'stylesheet_import')
     STAGING_DIR = os.path.join(WORK_DIR, 'xml_files')
     INPUT_FILE = os.path.join(os.getcwd(), 'input.txt')
+    JOURNAL_FILE = os.path.join(WORK_DIR, 'stylesheet_journal.jsonl')
 
     xml_files = collect_xml_files(args.target_path)
     if not xml_files:
@@ -164,21 +248,75 @@ def main():
 
     logging.info(f"Found {len(xml_files)} XML files to process.")
 
-    if not prepare_input_file(xml_files, STAGING_DIR, INPUT_FILE):
-        sys.exit(1)
-
-    import_stylesheets(
-        exe_path,
-        install_user,
-        install_pwf,
-        install_group,
-        INPUT_FILE,
-        STAGING_DIR,
-        args.tc_bat
-    )
+    if not args.skip_validation:
+        with span("validate") as s:
+            s.add_files(xml_files)
+            valid = log_index_report(build_index(xml_files))
+        if not valid:
+            logging.error("PLMXML reference validation failed, aborting before import.")
+            sys.exit(1)
 
+    # A stylesheet imported into the same site and group is a completed unit
+    target = f"{tc_root}|{install_group}"
+    MANIFEST_FILE = manifest_file(WORK_DIR, target)
+    manifest = {} if args.full else load_manifest(MANIFEST_FILE)
+    with span("hash") as s:
+        s.add_files(xml_files)
+        changed_files, hashes = select_changed_files(xml_files, manifest)
+    if not changed_files:
+        logging.info("No stylesheet changed since the last import, skipping install_xml_stylesheet_datasets.")
+        return
+
+    logging.info(f"{len(changed_files)} of {len(xml_files)} stylesheets are new or changed.")
+
+    journal = RunJournal(JOURNAL_FILE, resume=args.resume)
+    pending_files = [f for f in changed_files if not journal.is_done(target, f)]
+    if len(pending_files) < len(changed_files):
+        logging.info(f"Skipping {len(changed_files) - len(pending_files)} stylesheets already imported according to the journal.")
+    if not pending_files:
+        save_manifest(MANIFEST_FILE, update_manifest(load_manifest(MANIFEST_FILE), changed_files, hashes))
+        logging.info("Script completed successfully.")
+        return
+
+    pending_files = drop_duplicate_datasets(pending_files)
+    if args.shards > 1:
+        units = split_shards(pending_files, args.shards)
+    else:
+        units = split_chunks(pending_files, args.chunk_size)
+    if len(units) > 1:
+        # Leftover shard folders of an earlier run would hold other stylesheets
+        shutil.rmtree(os.path.join(WORK_DIR, "shards"), ignore_errors=True)
+
+    def run_unit(index, attempt):
+        files = units[index]
+        staging_dir, input_file = shard_paths(WORK_DIR, index) if len(units) > 1 else (STAGING_DIR, INPUT_FILE)
+        label = f"shard {index + 1}/{len(units)}" if len(units) > 1 else None
+        logging.info(f"Importing shard {index + 1} of {len(units)} ({len(files)} stylesheets)")
+        with span("stage", shard=index + 1) as s:
+            s.add_files(files)
+            prepared = prepare_input_file(files, staging_dir, input_file, backup_old=len(units) == 1)
+        if not prepared:
+            return False
+
+        with span("import", shard=index + 1, attempt=attempt + 1) as s:
+            s.add_files(files)
+            imported = import_stylesheets(exe_path, install_user, install_pwf, install_group, input_file, staging_dir, tc_env.env, label)
+        if imported:
+            for file_path in files:
+                journal.record(target, file_path)
+        return imported
+
+    failed = import_units(units, run_unit, max(1, args.max_parallel), max(0, args.retries))
+
+    # Stylesheets of the shards that went through are recorded, so the next run only imports the rest
+    failed_files = {file_path for index in failed for file_path in units[index]}
+    imported_files = [file_path for file_path in changed_files if file_path not in failed_files]
+    save_manifest(MANIFEST_FILE, update_manifest(load_manifest(MANIFEST_FILE), imported_files, hashes))
+    if failed:
+        logging.error(f"{len(failed)} of {len(units)} shard(s) failed after {args.retries + 1} attempt(s): {len(failed_files)} stylesheets were not imported.")
+        sys.exit(1)
     logging.info("Script completed successfully.")
 
 
 if __name__ == "__main__":
-    main()
+    run_traced("stylesheet", main)
@@ -0,0 +1,181 @@
+import os
+import sys
+import json
+import logging
+import argparse
+import subprocess
+import tempfile
+from collections import namedtuple
+
+from hash_utils import sha256_file, sha256_text
+from tracing import span
+
+# Always cached with their full value: the capturing shell may already have them set
+# (a TC command prompt, system variables on an agent) while later runs do not
+ALWAYS_CACHED_PREFIXES = ("TC_",)
+
+CACHE_DIR = os.path.join(os.getenv('TEMP', tempfile.gettempdir()), 'tc_env_cache')
+
+TcEnvironment = namedtuple("TcEnvironment", ["env", "tc_root", "tc_data"])
+
+
+def bat_fingerprint(bat_file_path):
+    """Identify a batch file by its absolute path, mtime and content hash."""
+    abs_path = os.path.normcase(os.path.abspath(bat_file_path))
+    return {
+        "path": abs_path,
+        "mtime_ns": os.stat(abs_path).st_mtime_ns,
+        "sha256": sha256_file(abs_path),
+    }
+
+
+def cache_file_for(bat_file_path, cache_dir=CACHE_DIR):
+    abs_path = os.path.normcase(os.path.abspath(bat_file_path))
+    return os.path.join(cache_dir, f"{sha256_text(abs_path)[:16]}.json")
+
+
+def environment_delta(captured, base, always_prefixes=ALWAYS_CACHED_PREFIXES):
+    """Return what the batch file changed relative to base, so the caller's own variables are not cached.
+
+    A value that wraps the inherited one (PATH with directories added in front) keeps
+    only the added parts, so it is applied on top of whatever PATH the next run has.
+    Variables starting with one of always_prefixes (TC_* by default) are kept with
+    their value even when base already has it.
+    """
+    inherited = {key.upper(): value for key, value in base.items()}
+    delta = {}
+    for key, value in captured.items():
+        old = inherited.get(key.upper())
+        if key.upper().startswith(tuple(prefix.upper() for prefix in always_prefixes)):
+            delta[key] = {"value": value}
+            continue
+        if old == value:
+            continue
+        if old and old in value:
+            start = value.index(old)
+            delta[key] = {"prepend": value[:start], "append": value[start + len(old):]}
+        else:
+            delta[key] = {"value": value}
+    return delta
+
+
+def apply_environment_delta(delta, base):
+    """Overlay a cached delta onto base (normally the current os.environ)."""
+    env = dict(base)
+    # Windows variable names are case-insensitive: update PATH even when the batch file printed Path
+    names = {key.upper(): key for key in env}
+    for key, change in delta.items():
+        name = names.get(key.upper(), key)
+        if "value" in change:
+            env[name] = change["value"]
+        else:
+            env[name] = change["prepend"] + env.get(name, "") + change["append"]
+    return env
+
+
+def capture_tc_environment(bat_file_path):
+    """Run the batch file once and return the variables it added or changed."""
+    logging.info(f"Running batch file to capture TC environment: {bat_file_path}")
+    process = subprocess.run(f'cmd /c "{bat_file_path} && set"', capture_output=True, shell=True, text=True)
+
+    if process.returncode != 0:
+        logging.error("Failed to execute batch file.")
+        logging.error(process.stderr)
+        return None
+
+    env = {}
+    for line in process.stdout.splitlines():
+        # cmd also prints hidden per-drive variables such as "=C:=C:\", skip them
+        if "=" not in line or line.startswith("="):
+            continue
+        key, value = line.split("=", 1)
+        env[key] = value.rstrip("\r")
+    return environment_delta(env, os.environ)
+
+
+def load_cached_environment(bat_file_path, cache_dir=CACHE_DIR):
+    cache_file = cache_file_for(bat_file_path, cache_dir)
+    if not os.path.isfile(cache_file):
+        return None
+
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable TC environment cache {cache_file}: {e}")
+        return None
+
+    if cached.get("fingerprint") != bat_fingerprint(bat_file_path):
+        logging.info("Batch file changed since the TC environment was cached.")
+        return None
+
+    # Caches written before only deltas were stored hold no "delta" and are captured again
+    return cached.get("delta")
+
+
+def save_cached_environment(bat_file_path, delta, cache_dir=CACHE_DIR):
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_file = cache_file_for(bat_file_path, cache_dir)
+    tmp_file = cache_file + ".tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump({"fingerprint": bat_fingerprint(bat_file_path), "delta": delta}, f, indent=2)
+    os.replace(tmp_file, cache_file)
+    logging.info(f"Cached TC environment at: {cache_file}")
+
+
+def load_tc_environment(bat_file_path, cache_dir=CACHE_DIR, refresh=False):
+    """Return the current environment with the batch file's changes applied, using the on-disk cache when valid."""
+    delta = None if refresh else load_cached_environment(bat_file_path, cache_dir)
+    if delta is not None and not all(key in {k.upper() for k in delta} for key in ("TC_ROOT", "TC_DATA")):
+        # Written before TC_* variables were always kept, from a shell that already had them
+        logging.info("Cached TC environment lacks TC_ROOT or TC_DATA, capturing it again.")
+        delta = None
+    if delta is not None:
+        logging.info(f"Using cached TC environment for: {bat_file_path}")
+    else:
+        delta = capture_tc_environment(bat_file_path)
+        if delta is None:
+            return None
+        save_cached_environment(bat_file_path, delta, cache_dir)
+    return apply_environment_delta(delta, os.environ)
+
+
+def resolve_tc_environment(bat_file_path, cache_dir=CACHE_DIR, refresh=False):
+    """Resolve TC_ROOT/TC_DATA and the environment to pass as env= to later subprocesses."""
+    if not os.path.isfile(bat_file_path):
+        logging.error(f"Batch file not found: {bat_file_path}")
+        sys.exit(1)
+
+    with span("env_resolve", bat=os.path.abspath(bat_file_path)):
+        env = load_tc_environment(bat_file_path, cache_dir, refresh)
+    if env is None:
+        sys.exit(1)
+
+    tc_root = env.get("TC_ROOT", "").strip()
+    tc_data = env.get("TC_DATA", "").strip()
+    if not tc_root or not tc_data:
+        logging.error("Could not extract TC_ROOT or TC_DATA from batch file output.")
+        sys.exit(1)
+
+    os.environ['TC_ROOT'] = tc_root
+    os.environ['TC_DATA'] = tc_data
+    logging.info(f"Set TC_ROOT={tc_root}")
+    logging.info(f"Set TC_DATA={tc_data}")
+
+    return TcEnvironment(env, tc_root, tc_data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Capture and cache the environment set by a Teamcenter batch file.")
+    parser.add_argument("tc_bat", help="Path to batch file to set TC environment")
+    parser.add_argument("--refresh", action="store_true", help="Ignore the cache and re-run the batch file")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="Directory holding cached environments")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    tc_env = resolve_tc_environment(args.tc_bat, args.cache_dir, args.refresh)
+    logging.info(f"Captured {len(tc_env.env)} environment variables.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import re
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+
+# (phase name, pattern) in the order TEM prints them. A match starts a new phase and
+# closes the one before it; "{0}" in a name is filled from the first group. Patterns
+# are anchored to the line that starts the phase: TEM mentions most of these words
+# elsewhere too (the operation header, template names, tool names).
+PHASE_PATTERNS = [
+    ("TEM lock", re.compile(r"^\s*Acquiring TEM lock", re.I)),
+    ("Load software depot", re.compile(r"^\s*Loading software depot", re.I)),
+    ("Gopher file transfer", re.compile(r"^\s*Gopher is getting files", re.I)),
+    ("Load features", re.compile(r"^\s*Number of features loaded", re.I)),
+    ("Begin update", re.compile(r"^\s*Beginning update\s*$", re.I)),
+    ("Data model update", re.compile(r"^\s*Updating database:", re.I)),
+    ("Deploy runner", re.compile(r"^\s*Deploy Runner execution begins", re.I)),
+    ("Deploy step {0}", re.compile(r"^\s*Step (\d+) of \d+", re.I)),
+    ("Preferences update", re.compile(r"^\s*Executing tool: .*preferences updater", re.I)),
+    ("Log auto-archive", re.compile(r"^\s*Begin Task: Log auto-archive", re.I)),
+]
+# Lines that end the current phase without starting another one
+END_PATTERNS = [
+    re.compile(r"^\s*Preferences update time:", re.I),
+    re.compile(r"^\s*Operation successful", re.I),
+]
+
+
+class PhaseTracker:
+    """Time the phases of a TEM run from its output lines.
+
+    Pass tracker.on_line as the on_line callback of process_runner.run_streaming.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.phases = []
+        self.current = None
+        self.index = -1
+        self._open("Startup", self.started)
+
+    def _open(self, name, now, line=None):
+        self.current = {"name": name, "start": now, "end": None, "duration": None, "first_line": line}
+        self.phases.append(self.current)
+
+    def _close(self, now):
+        if self.current:
+            self.current["end"] = now
+            self.current["duration"] = round(now - self.current["start"], 3)
+            self.current = None
+
+    def on_line(self, stream_name, line):
+        now = time.time()
+        for index, (name, pattern) in enumerate(PHASE_PATTERNS):
+            match = pattern.search(line)
+            if match:
+                name = name.format(*match.groups())
+                with self.lock:
+                    # Phases only move forward: TEM reloads the depot and gopher more than once,
+                    # and repeated progress lines of the same phase do not restart it
+                    if index < self.index or (self.current and self.current["name"] == name):
+                        return
+                    self.index = index
+                    self._close(now)
+                    self._open(name, now, line.strip())
+                logging.info(f"TEM phase started: {name}")
+                return
+        if any(pattern.search(line) for pattern in END_PATTERNS):
+            with self.lock:
+                self._close(now)
+
+    def finish(self, returncode):
+        with self.lock:
+            now = time.time()
+            self._close(now)
+            self.returncode = returncode
+            self.finished = now
+
+    def to_record(self):
+        def iso(ts):
+            return datetime.fromtimestamp(ts).isoformat() if ts else None
+
+        return {
+            "start": iso(self.started),
+            "end": iso(self.finished),
+            "duration": round(self.finished - self.started, 3),
+            "returncode": self.returncode,
+            "phases": [
+                {**phase, "start": iso(phase["start"]), "end": iso(phase["end"])}
+                for phase in self.phases
+            ],
+        }
+
+    def write_record(self, record_file, **metadata):
+        record = {**metadata, **self.to_record()}
+        with open(record_file, 'w', encoding='utf-8') as f:
+            json.dump(record, f, indent=2)
+        logging.info(f"Phase timings written to {record_file}")
+
+    def log_summary(self):
+        total = self.finished - self.started
+        lines = [f"{'Phase':<30} {'Duration (s)':>12} {'Share':>7}"]
+        for phase in self.phases:
+            share = phase["duration"] / total * 100 if total else 0
+            lines.append(f"{phase['name']:<30} {phase['duration']:>12.1f} {share:>6.1f}%")
+        lines.append(f"{'Total':<30} {total:>12.1f}")
+        logging.info("TEM phase summary:\n" + "\n".join(lines))
@@ -0,0 +1,109 @@
+import os
+import time
+import zlib
+import zipfile
+import logging
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+from hash_utils import sha256_file
+
+# Entries every Teamcenter software kit has at its root
+FULLKIT_MARKERS = ("tem.bat", "tc")
+
+DEFAULT_WORKERS = min(8, (os.cpu_count() or 1) + 2)
+
+
+def expected_package_files(template_name):
+    """Files a BMIDE full_update package for template_name must contain, relative to its folder.
+
+    The archives sit under artifacts\\ next to the optional icons and project zips;
+    the platform is part of the package folder name, not of any file name.
+    """
+    return [
+        os.path.join("tem_contributions", f"feature_{template_name}.xml"),
+        f"media_teamcenter_{template_name}.xml",
+        os.path.join("artifacts", f"{template_name}_template.zip"),
+        os.path.join("artifacts", f"{template_name}_install.zip"),
+    ]
+
+
+def check_archive(zip_path):
+    """Hash a zip and CRC-check every member. Returns (zip_path, sha256, problem or None)."""
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            bad_member = archive.testzip()
+    except (zipfile.BadZipFile, zlib.error, OSError) as e:
+        return zip_path, None, f"corrupt or unreadable archive: {e}"
+    if bad_member:
+        return zip_path, None, f"CRC error in member {bad_member}"
+    return zip_path, sha256_file(zip_path), None
+
+
+def check_package(package_path, template_name, workers=DEFAULT_WORKERS):
+    """Return the problems found in the package folder; archives are checked in parallel."""
+    if not os.path.isdir(package_path):
+        return [f"Package folder not found: {package_path}"]
+
+    problems = []
+    for name in expected_package_files(template_name):
+        if not os.path.isfile(os.path.join(package_path, name)):
+            problems.append(f"Package file missing: {os.path.join(package_path, name)}")
+
+    for manifest in (os.path.join(package_path, "tem_contributions", f"feature_{template_name}.xml"),
+                     os.path.join(package_path, f"media_teamcenter_{template_name}.xml")):
+        if os.path.isfile(manifest):
+            try:
+                ET.parse(manifest)
+            except ET.ParseError as e:
+                problems.append(f"Package manifest {manifest} is not valid XML: {e}")
+
+    artifacts_dir = os.path.join(package_path, "artifacts")
+    zip_paths = sorted(os.path.join(artifacts_dir, f) for f in os.listdir(artifacts_dir) if f.lower().endswith(".zip")) if os.path.isdir(artifacts_dir) else []
+    # zlib and hashlib release the GIL, so threads check the archives concurrently
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for zip_path, sha256, problem in executor.map(check_archive, zip_paths):
+            if problem:
+                problems.append(f"{zip_path}: {problem}")
+            else:
+                logging.info(f"Archive OK: {os.path.basename(zip_path)} sha256={sha256}")
+    return problems
+
+
+def check_fullkit(fullkit_path):
+    if not os.path.isdir(fullkit_path):
+        return [f"Fullkit folder not found: {fullkit_path}"]
+    return [
+        f"Fullkit marker missing: {os.path.join(fullkit_path, marker)}"
+        for marker in FULLKIT_MARKERS
+        if not os.path.exists(os.path.join(fullkit_path, marker))
+    ]
+
+
+def check_password_file(pf_file_path):
+    if not os.path.isfile(pf_file_path):
+        return [f"Password file not found: {pf_file_path}"]
+    if os.path.getsize(pf_file_path) == 0:
+        return [f"Password file is empty: {pf_file_path}"]
+    return []
+
+
+def run_preflight(tc_root, template_name, pf_file, fullkit_path, package_path):
+    """Run every pre-flight check and log the problems. Returns True when tem.bat can start."""
+    start = time.monotonic()
+    problems = []
+    tem_bat = os.path.join(tc_root, "install", "tem.bat")
+    if not os.path.isfile(tem_bat):
+        problems.append(f"tem.bat not found: {tem_bat}")
+    problems += check_password_file(os.path.join(tc_root, "security", pf_file))
+    problems += check_fullkit(fullkit_path)
+    problems += check_package(package_path, template_name)
+
+    for problem in problems:
+        logging.error(f"Pre-flight: {problem}")
+    elapsed = time.monotonic() - start
+    if problems:
+        logging.error(f"Pre-flight failed with {len(problems)} problem(s) in {elapsed:.1f}s; tem.bat was not started.")
+        return False
+    logging.info(f"Pre-flight checks passed in {elapsed:.1f}s.")
+    return True
@@ -0,0 +1,47 @@
+import os
+import json
+import asyncio
+
+from host_fanout import build_host_script, build_matrix, fan_out
+from list_services import load_dependency_graph
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FSC = "Teamcenter FSC Service FSC_DEVBOX_DENBG0145VMinfodba"
+
+
+def shipped_services():
+    with open(os.path.join(REPO_DIR, "services.txt"), 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def test_shipped_graph_patterns_order_the_waves():
+    services = shipped_services()
+    waves, _ = build_host_script(services, load_dependency_graph(os.path.join(REPO_DIR, "services_graph.json")), "start", 120)
+
+    wave_of = {name: number for number, wave in enumerate(waves) for name in wave}
+    assert wave_of[FSC] < wave_of["Teamcenter Process Manager"] < wave_of["Active Workspace Indexing Service"]
+
+
+def test_fan_out_with_in_process_transport():
+    services = ["Service A", "Service B"]
+    calls = []
+
+    async def fake_transport(host, ps_script):
+        calls.append(host)
+        if host == "down":
+            raise RuntimeError("WinRM unreachable")
+        if host == "slow":
+            await asyncio.sleep(5)
+        results = [{"display_name": "Service A", "action": "start", "after": "Running"},
+                   {"display_name": "Service B", "action": "failed" if host == "flaky" else "start", "after": "Stopped" if host == "flaky" else "Running"}]
+        return json.dumps(results)
+
+    hosts = ["app1", "flaky", "down", "slow"]
+    outcomes = asyncio.run(fan_out(hosts, fake_transport, "script", concurrency=2, timeout=0.5))
+
+    assert sorted(calls) == sorted(hosts)
+    assert [o["host"] for o in outcomes] == hosts
+    assert [o["status"] for o in outcomes] == ["ok", "ok", "error", "timeout"]
+    matrix = build_matrix(outcomes, services)
+    assert matrix["Service A"] == {"app1": "Running", "flaky": "Running", "down": "ERROR", "slow": "TIMEOUT"}
+    assert matrix["Service B"]["flaky"] == "FAILED"
@@ -0,0 +1,90 @@
+import pytest
+
+from preferences_xml import (
+    PreferenceFileError, merge_preference_files, write_preference_document,
+    load_preference_values, changed_preferences, filter_preference_document,
+)
+
+
+def write_preferences(path, categories):
+    """categories maps a category name to {preference name: {context name: [values]}}."""
+    lines = ['<?xml version="1.0" encoding="ISO-8859-15"?>', '<preferences version="10.0">']
+    for category_name, preferences in categories.items():
+        lines.append(f'  <category name="{category_name}">')
+        lines.append('    <category_description>Test preferences</category_description>')
+        for name, contexts in preferences.items():
+            lines.append(f'    <preference name="{name}" type="String" array="true" disabled="false" protectionScope="Site" envEnabled="false">')
+            for context_name, values in contexts.items():
+                lines.append(f'      <context name="{context_name}">')
+                lines.extend(f'        <value>{value}</value>' for value in values)
+                lines.append('      </context>')
+            lines.append('    </preference>')
+        lines.append('  </category>')
+    lines.append('</preferences>')
+    path.write_text("\n".join(lines), encoding="ISO-8859-15")
+    return str(path)
+
+
+def merged_values(tmp_path, paths, action):
+    root, count = merge_preference_files(paths, action)
+    output = tmp_path / "merged.xml"
+    write_preference_document(root, str(output))
+    return load_preference_values(str(output)), count
+
+
+def test_override_later_file_wins(tmp_path):
+    first = write_preferences(tmp_path / "a.xml", {"General": {"P1": {"Teamcenter": ["old"]}, "P2": {"Teamcenter": ["keep"]}}})
+    second = write_preferences(tmp_path / "b.xml", {"General": {"P1": {"Teamcenter": ["new"]}}})
+
+    values, count = merged_values(tmp_path, [first, second], "OVERRIDE")
+    assert count == 2
+    assert values[("P1", "Teamcenter")] == ("new",)
+    assert values[("P2", "Teamcenter")] == ("keep",)
+
+
+@pytest.mark.parametrize("action", ["ADD", "REMOVE"])
+def test_add_and_remove_merge_values_per_context(tmp_path, action):
+    first = write_preferences(tmp_path / "a.xml", {"General": {"P1": {"Teamcenter": ["a", "b"], "dba": ["x"]}}})
+    second = write_preferences(tmp_path / "b.xml", {"General": {"P1": {"Teamcenter": ["b", "c"], "Site": ["s"]}}})
+
+    values, count = merged_values(tmp_path, [first, second], action)
+    assert count == 1
+    assert values[("P1", "Teamcenter")] == ("a", "b", "c")
+    assert values[("P1", "dba")] == ("x",)
+    assert values[("P1", "Site")] == ("s",)
+
+
+def test_unchanged_export_gives_empty_delta(tmp_path):
+    desired_path = write_preferences(tmp_path / "desired.xml", {"General": {"P1": {"Teamcenter": ["a", "b"]}}})
+    export_path = write_preferences(tmp_path / "export.xml", {"General": {"P1": {"Teamcenter": ["a", "b"]}}, "Other": {"P9": {"Teamcenter": ["z"]}}})
+    desired, current = load_preference_values(desired_path), load_preference_values(export_path)
+
+    assert changed_preferences(desired, current, "OVERRIDE") == set()
+    assert changed_preferences(desired, current, "ADD") == set()
+    assert changed_preferences({("P1", "Teamcenter"): ("c",)}, current, "REMOVE") == set()
+
+
+def test_delta_keeps_only_changed_preferences(tmp_path):
+    desired_path = write_preferences(tmp_path / "desired.xml", {
+        "General": {"P1": {"Teamcenter": ["a"]}, "P2": {"Teamcenter": ["new"]}},
+        "Unchanged": {"P3": {"Teamcenter": ["c"]}},
+    })
+    export_path = write_preferences(tmp_path / "export.xml", {
+        "General": {"P1": {"Teamcenter": ["a"]}, "P2": {"Teamcenter": ["old"]}},
+        "Unchanged": {"P3": {"Teamcenter": ["c"]}},
+    })
+
+    changed = changed_preferences(load_preference_values(desired_path), load_preference_values(export_path), "OVERRIDE")
+    assert changed == {"P2"}
+
+    root, _ = merge_preference_files([desired_path], "OVERRIDE")
+    filter_preference_document(root, changed)
+    assert [c.get("name") for c in root.findall("category")] == ["General"]
+    assert [p.get("name") for p in root.iter("preference")] == ["P2"]
+
+
+def test_invalid_root_is_rejected(tmp_path):
+    path = tmp_path / "bad.xml"
+    path.write_text('<?xml version="1.0"?><settings/>', encoding="utf-8")
+    with pytest.raises(PreferenceFileError):
+        merge_preference_files([str(path)], "OVERRIDE")
@@ -0,0 +1,18 @@
+import sys
+
+from process_runner import run_streaming
+
+
+def test_failing_callback_does_not_stop_reading():
+    seen = []
+
+    def on_line(stream_name, line):
+        seen.append(line)
+        raise ValueError("callback bug")
+
+    # Far more output than a pipe buffer holds, so a reader that stopped would hang the child
+    command = [sys.executable, "-c", "for i in range(20000): print('x' * 100)"]
+    result = run_streaming(command, shell=False, on_line=on_line)
+
+    assert result.returncode == 0
+    assert len(seen) == 20000
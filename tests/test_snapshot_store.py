@@ -0,0 +1,40 @@
+import os
+
+from snapshot_store import create_snapshot, restore_snapshot, apply_retention
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_same_content_compressed_and_raw_restores(tmp_path):
+    source, store, target = tmp_path / "src", tmp_path / "store", tmp_path / "out"
+    write(str(source / "a.png"), b"same bytes")
+    write(str(source / "a.txt"), b"same bytes")
+    write(str(source / "empty.zip"), b"")
+    write(str(source / "empty.log"), b"")
+
+    snapshot_path, stats = create_snapshot(str(source), str(store))
+    assert stats["new_blobs"] == 4
+    restore_snapshot(snapshot_path, str(store), str(target))
+
+    for name in ("a.png", "a.txt", "empty.zip", "empty.log"):
+        assert read(str(target / name)) == read(str(source / name))
+
+
+def test_retention_keeps_in_flight_blobs(tmp_path):
+    source, store = tmp_path / "src", tmp_path / "store"
+    write(str(source / "a.txt"), b"a")
+    create_snapshot(str(source), str(store))
+    in_flight = store / "blobs" / "ff" / "ff00.z.123.tmp"
+    write(str(in_flight), b"partial")
+
+    apply_retention(str(store), 1)
+    assert in_flight.exists()
@@ -0,0 +1,33 @@
+import tc_env
+from tc_env import environment_delta, apply_environment_delta
+
+
+def test_delta_keeps_only_batch_file_changes():
+    base = {"PATH": "C:\\Windows", "JOB_NAME": "deploy-dev", "TEMP": "C:\\Temp"}
+    captured = {"Path": "D:\\tc_root\\bin;C:\\Windows", "JOB_NAME": "deploy-dev", "TEMP": "C:\\Temp", "TC_ROOT": "D:\\tc_root"}
+
+    delta = environment_delta(captured, base)
+    assert delta == {"Path": {"prepend": "D:\\tc_root\\bin;", "append": ""}, "TC_ROOT": {"value": "D:\\tc_root"}}
+
+    later = {"PATH": "C:\\Windows;C:\\Tools", "JOB_NAME": "deploy-prod"}
+    env = apply_environment_delta(delta, later)
+    assert env == {"PATH": "D:\\tc_root\\bin;C:\\Windows;C:\\Tools", "JOB_NAME": "deploy-prod", "TC_ROOT": "D:\\tc_root"}
+
+
+def test_tc_variables_kept_when_capturing_shell_already_has_them():
+    tc_vars = {"TC_ROOT": "D:\\tc_root", "TC_DATA": "D:\\tc_data"}
+
+    delta = environment_delta(dict(tc_vars), dict(tc_vars))
+    assert delta == {"TC_ROOT": {"value": "D:\\tc_root"}, "TC_DATA": {"value": "D:\\tc_data"}}
+    assert apply_environment_delta(delta, {"PATH": "C:\\Windows"}) == {"PATH": "C:\\Windows", **tc_vars}
+
+
+def test_cache_without_tc_root_is_captured_again(tmp_path, monkeypatch):
+    bat_file = tmp_path / "tc.bat"
+    bat_file.write_text("@echo off\n")
+    tc_env.save_cached_environment(str(bat_file), {}, str(tmp_path))
+    monkeypatch.setattr(tc_env, "capture_tc_environment", lambda path: {"TC_ROOT": {"value": "D:\\tc_root"}, "TC_DATA": {"value": "D:\\tc_data"}})
+
+    env = tc_env.load_tc_environment(str(bat_file), str(tmp_path))
+    assert env["TC_ROOT"] == "D:\\tc_root"
+    assert tc_env.load_cached_environment(str(bat_file), str(tmp_path))["TC_DATA"] == {"value": "D:\\tc_data"}
@@ -0,0 +1,28 @@
+import os
+
+from tem_phases import PhaseTracker
+
+LOG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bmide_update_2025-07-16_13-15-24.log")
+
+
+def test_replay_checked_in_log():
+    tracker = PhaseTracker()
+    with open(LOG_FILE, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            tracker.on_line("stdout", line.rstrip("\r\n"))
+    tracker.finish(0)
+
+    assert [phase["name"] for phase in tracker.phases] == [
+        "Startup",
+        "TEM lock",
+        "Load software depot",
+        "Gopher file transfer",
+        "Load features",
+        "Begin update",
+        "Data model update",
+        "Deploy runner",
+        *[f"Deploy step {step}" for step in range(1, 23)],
+        "Preferences update",
+        "Log auto-archive",
+    ]
+    assert tracker.phases[-2]["first_line"].startswith("Executing tool: ENTCBA")
@@ -0,0 +1,33 @@
+import os
+import zipfile
+
+from tem_preflight import check_package
+
+TEMPLATE = "b2testpoc"
+
+
+def write_package(folder):
+    os.makedirs(os.path.join(folder, "tem_contributions"))
+    os.makedirs(os.path.join(folder, "artifacts"))
+    with open(os.path.join(folder, "tem_contributions", f"feature_{TEMPLATE}.xml"), 'w') as f:
+        f.write("<feature/>")
+    with open(os.path.join(folder, f"media_teamcenter_{TEMPLATE}.xml"), 'w') as f:
+        f.write("<media/>")
+    for suffix in ("template", "install", "icons", "project_tc2412"):
+        with zipfile.ZipFile(os.path.join(folder, "artifacts", f"{TEMPLATE}_{suffix}.zip"), 'w') as archive:
+            archive.writestr("payload.txt", "payload")
+
+
+def test_package_as_bmide_writes_it_passes(tmp_path):
+    package = str(tmp_path / f"{TEMPLATE}_wntx64_1.0_1_2412_2025_07_15_13-50-30")
+    write_package(package)
+    assert check_package(package, TEMPLATE) == []
+
+
+def test_corrupt_artifact_is_reported(tmp_path):
+    package = str(tmp_path / "package")
+    write_package(package)
+    with open(os.path.join(package, "artifacts", f"{TEMPLATE}_icons.zip"), 'wb') as f:
+        f.write(b"not a zip")
+    problems = check_package(package, TEMPLATE)
+    assert len(problems) == 1 and f"{TEMPLATE}_icons.zip" in problems[0]
@@ -0,0 +1,239 @@
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+
+# A parent process (the orchestrator) passes these on so the spans of its children nest under its own
+TRACE_FILE_ENV = "DEPLOY_TRACE_FILE"
+TRACE_RUN_ENV = "DEPLOY_TRACE_RUN"
+TRACE_PARENT_ENV = "DEPLOY_TRACE_PARENT"
+DEFAULT_TRACE_FILE = "deploy_trace.jsonl"
+
+_state = {"trace_file": None, "run": None, "script": None, "parent": None, "root": None}
+_write_lock = threading.Lock()
+_local = threading.local()
+
+
+class Span:
+    """One timed step. exit_code, bytes and files are filled in while the step runs."""
+
+    def __init__(self, name, parent, attrs):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.parent = parent
+        self.attrs = attrs
+        self.exit_code = None
+        self.bytes = 0
+        self.files = 0
+        self.start = datetime.now()
+        self.started = time.monotonic()
+
+    def set(self, exit_code=None, **attrs):
+        if exit_code is not None:
+            self.exit_code = exit_code
+        self.attrs.update(attrs)
+
+    def add(self, bytes=0, files=0):
+        self.bytes += bytes
+        self.files += files
+
+    def add_files(self, file_paths):
+        """Count the given files and their sizes as processed by this step."""
+        for file_path in file_paths:
+            self.add(os.path.getsize(file_path) if os.path.isfile(file_path) else 0, 1)
+
+    def to_record(self, duration, status):
+        return {
+            "run": _state["run"],
+            "script": _state["script"],
+            "span": self.id,
+            "parent": self.parent,
+            "name": self.name,
+            "start": self.start.isoformat(),
+            "duration": round(duration, 3),
+            "status": status,
+            "exit_code": self.exit_code,
+            "bytes": self.bytes,
+            "files": self.files,
+            "attrs": self.attrs,
+        }
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+def init_trace(script, trace_file=None):
+    """Start writing spans for this process; a run started by a parent process is joined."""
+    _state["trace_file"] = os.path.abspath(trace_file or os.environ.get(TRACE_FILE_ENV) or DEFAULT_TRACE_FILE)
+    _state["run"] = os.environ.get(TRACE_RUN_ENV) or datetime.now().strftime("%Y%m%d_%H%M%S_") + uuid.uuid4().hex[:6]
+    _state["script"] = script
+    _state["parent"] = os.environ.get(TRACE_PARENT_ENV) or None
+
+
+def current_span():
+    """The innermost open span of this thread, or a detached one that is never written."""
+    stack = _stack()
+    return stack[-1] if stack else Span(None, None, {})
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time the enclosed step and append it to the trace file when it ends.
+
+    Spans opened in worker threads have the process's root span as parent. Without
+    init_trace nothing is written, so library code can open spans unconditionally.
+    """
+    stack = _stack()
+    current = Span(name, stack[-1].id if stack else (_state["root"] or _state["parent"]), attrs)
+    if _state["root"] is None and _state["run"]:
+        _state["root"] = current.id
+    stack.append(current)
+    status = "ok"
+    try:
+        yield current
+    except SystemExit as e:
+        if current.exit_code is None:
+            current.exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        raise
+    except BaseException as e:
+        status = "error"
+        current.attrs["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        stack.pop()
+        if status == "ok" and current.exit_code not in (None, 0):
+            status = "failed"
+        _write(current.to_record(time.monotonic() - current.started, status))
+
+
+def _write(record):
+    if not _state["trace_file"]:
+        return
+    with _write_lock:
+        with open(_state["trace_file"], 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + "\n")
+
+
+def child_env(env=None):
+    """Return env (default os.environ) with the variables that nest a child process under the current span."""
+    env = dict(os.environ if env is None else env)
+    if _state["trace_file"]:
+        env[TRACE_FILE_ENV] = _state["trace_file"]
+        env[TRACE_RUN_ENV] = _state["run"]
+        env[TRACE_PARENT_ENV] = current_span().id if _stack() else (_state["root"] or _state["parent"] or "")
+    return env
+
+
+def run_traced(script, main):
+    """Run a script's main() inside a root span named after the script."""
+    init_trace(script)
+    with span(script) as root:
+        main()
+        root.set(exit_code=0)
+
+
+def load_spans(trace_file):
+    spans = []
+    with open(trace_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                spans.append(json.loads(line))
+            except ValueError:
+                continue
+    return spans
+
+
+def runs_in_order(spans):
+    """Run ids ordered by the start of their first span."""
+    first_start = {}
+    for s in spans:
+        if s["run"] not in first_start or s["start"] < first_start[s["run"]]:
+            first_start[s["run"]] = s["start"]
+    return sorted(first_start, key=first_start.get)
+
+
+def aggregate(spans, run):
+    """Return {"script/step": {count, seconds, bytes, files, failed}} for one run."""
+    steps = {}
+    for s in spans:
+        if s["run"] != run:
+            continue
+        step = steps.setdefault(f"{s['script']}/{s['name']}", {"count": 0, "seconds": 0.0, "bytes": 0, "files": 0, "failed": 0})
+        step["count"] += 1
+        step["seconds"] += s["duration"]
+        step["bytes"] += s["bytes"]
+        step["files"] += s["files"]
+        step["failed"] += s["status"] != "ok"
+    return steps
+
+
+def summarize(spans, run):
+    steps = aggregate(spans, run)
+    width = max([len(k) for k in steps] + [4])
+    print(f"Run {run}")
+    print(f"{'Step':<{width}}  {'Count':>5}  {'Seconds':>9}  {'Files':>7}  {'Bytes':>12}  {'Failed':>6}")
+    for key, step in sorted(steps.items(), key=lambda item: -item[1]["seconds"]):
+        print(f"{key:<{width}}  {step['count']:>5}  {step['seconds']:>9.2f}  {step['files']:>7}  {step['bytes']:>12}  {step['failed']:>6}")
+
+
+def compare(spans, base_run, run):
+    base, current = aggregate(spans, base_run), aggregate(spans, run)
+    width = max([len(k) for k in {**base, **current}] + [4])
+    print(f"Base run {base_run}, compared run {run}")
+    print(f"{'Step':<{width}}  {'Base (s)':>9}  {'Run (s)':>9}  {'Delta (s)':>9}  {'Delta %':>8}")
+    keys = sorted(set(base) | set(current), key=lambda k: -abs(current.get(k, {}).get("seconds", 0.0) - base.get(k, {}).get("seconds", 0.0)))
+    for key in keys:
+        before = base.get(key, {}).get("seconds")
+        after = current.get(key, {}).get("seconds")
+        delta = (after or 0.0) - (before or 0.0)
+        if before is None:
+            percent = "new"
+        elif after is None:
+            percent = "gone"
+        else:
+            percent = f"{delta / before * 100:+.0f}%" if before else "-"
+        before_text = "-" if before is None else f"{before:.2f}"
+        after_text = "-" if after is None else f"{after:.2f}"
+        print(f"{key:<{width}}  {before_text:>9}  {after_text:>9}  {delta:>+9.2f}  {percent:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize the timing spans of deploy runs, or compare two runs.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    summarize_parser = subparsers.add_parser("summarize", help="Time, files and bytes per step of one run")
+    summarize_parser.add_argument("trace_file", nargs="?", default=DEFAULT_TRACE_FILE, help="JSONL trace file")
+    summarize_parser.add_argument("--run", help="Run id (default: the latest run)")
+    compare_parser = subparsers.add_parser("compare", help="Per-step time difference between two runs")
+    compare_parser.add_argument("trace_file", nargs="?", default=DEFAULT_TRACE_FILE, help="JSONL trace file")
+    compare_parser.add_argument("--base", help="Run id to compare against (default: the run before --run)")
+    compare_parser.add_argument("--run", help="Run id (default: the latest run)")
+    args = parser.parse_args()
+
+    spans = load_spans(args.trace_file)
+    runs = runs_in_order(spans)
+    run = args.run or (runs[-1] if runs else None)
+    if run not in runs:
+        print(f"Run {run} not found in {args.trace_file}")
+        sys.exit(1)
+
+    if args.command == "summarize":
+        summarize(spans, run)
+        return
+
+    base_run = args.base or (runs[runs.index(run) - 1] if runs.index(run) > 0 else None)
+    if base_run not in runs:
+        print(f"No run to compare {run} against in {args.trace_file}")
+        sys.exit(1)
+    compare(spans, base_run, run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import os
+import sys
+import shutil
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from hash_utils import DEFAULT_WORKERS, sha256_file, walk_tree
+
+
+def needs_copy(source_path, target_path, source_stat, target_stat, checksum):
+    if target_stat is None or source_stat.st_size != target_stat.st_size:
+        return True
+    if checksum:
+        return sha256_file(source_path) != sha256_file(target_path)
+    return source_stat.st_mtime_ns != target_stat.st_mtime_ns
+
+
+def sync_tree(source_dir, target_dir, checksum=False, workers=DEFAULT_WORKERS):
+    """Make target_dir mirror source_dir, copying only changed files.
+
+    Files are compared by size and mtime (or by content hash when checksum is set).
+    Returns a dict of counters for copied, skipped and deleted files and bytes.
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    source_files, source_dirs = walk_tree(source_dir)
+    target_files, target_dirs = walk_tree(target_dir)
+
+    stats = {"copied_files": 0, "copied_bytes": 0, "skipped_files": 0, "skipped_bytes": 0, "deleted_files": 0, "deleted_dirs": 0}
+
+    # Entries whose type changed (file <-> directory) have to go before anything is copied
+    for rel_path in sorted(source_dirs & set(target_files)):
+        os.unlink(os.path.join(target_dir, rel_path))
+        del target_files[rel_path]
+        stats["deleted_files"] += 1
+    for rel_path in sorted(set(source_files) & target_dirs):
+        target_path = os.path.join(target_dir, rel_path)
+        if os.path.isdir(target_path):
+            shutil.rmtree(target_path)
+            stats["deleted_dirs"] += 1
+        target_dirs = {d for d in target_dirs if d != rel_path and not d.startswith(rel_path + "/")}
+        target_files = {f: st for f, st in target_files.items() if not f.startswith(rel_path + "/")}
+
+    for rel_path in sorted(source_dirs - target_dirs):
+        os.makedirs(os.path.join(target_dir, rel_path), exist_ok=True)
+
+    def check(rel_path):
+        source_path = os.path.join(source_dir, rel_path)
+        target_path = os.path.join(target_dir, rel_path)
+        return rel_path, needs_copy(source_path, target_path, source_files[rel_path], target_files.get(rel_path), checksum)
+
+    def copy(rel_path):
+        shutil.copy2(os.path.join(source_dir, rel_path), os.path.join(target_dir, rel_path))
+        return source_files[rel_path].st_size
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        to_copy = []
+        for rel_path, changed in executor.map(check, source_files):
+            if changed:
+                to_copy.append(rel_path)
+            else:
+                stats["skipped_files"] += 1
+                stats["skipped_bytes"] += source_files[rel_path].st_size
+
+        for size in executor.map(copy, to_copy):
+            stats["copied_files"] += 1
+            stats["copied_bytes"] += size
+
+    for rel_path in target_files.keys() - source_files.keys():
+        os.unlink(os.path.join(target_dir, rel_path))
+        stats["deleted_files"] += 1
+
+    # Deepest directories first, so parents are empty when they are removed
+    for rel_path in sorted(target_dirs - source_dirs, key=len, reverse=True):
+        target_path = os.path.join(target_dir, rel_path)
+        if os.path.isdir(target_path):
+            shutil.rmtree(target_path)
+            stats["deleted_dirs"] += 1
+
+    logging.info(
+        f"Synced {source_dir} -> {target_dir}: {stats['copied_files']} files copied ({stats['copied_bytes']} bytes), "
+        f"{stats['skipped_files']} unchanged ({stats['skipped_bytes']} bytes), "
+        f"{stats['deleted_files']} files and {stats['deleted_dirs']} directories deleted"
+    )
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mirror a directory tree, copying only changed files.")
+    parser.add_argument("source_dir")
+    parser.add_argument("target_dir")
+    parser.add_argument("--checksum", action="store_true", help="Compare file contents instead of size and mtime")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Number of copy threads")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if not os.path.isdir(args.source_dir):
+        logging.error(f"Source directory not found: {args.source_dir}")
+        sys.exit(1)
+    sync_tree(args.source_dir, args.target_dir, args.checksum, args.workers)
+
+
+if __name__ == "__main__":
+    main()